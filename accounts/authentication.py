@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .models import CustomUser
+
+# what permission checks need, every other field is loaded on first access
+CACHED_FIELDS = ("id", "is_active", "is_confirmed", "is_agent", "is_customer")
+
+TOKEN_CACHE_TIMEOUT = 60 * 15
+# entries in a worker's own LRU aren't invalidated by other workers, so keep them short lived
+LOCAL_CACHE_TIMEOUT = 30
+LOCAL_CACHE_SIZE = 2048
+
+
+class LocalLRUCache:
+    """
+    Bounded, thread safe, in-process LRU with a per entry timeout
+    """
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_cache = LocalLRUCache(LOCAL_CACHE_SIZE, LOCAL_CACHE_TIMEOUT)
+
+
+def token_cache_key(key):
+    return f"accounts:token:{key}"
+
+
+def invalidate_tokens(*keys):
+    cache.delete_many([token_cache_key(key) for key in keys])
+    for key in keys:
+        local_cache.delete(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement for `TokenAuthentication` that resolves tokens from an
+    in-process LRU, then the shared cache, and only then the Token+User join.
+
+    `request.user` only has `CACHED_FIELDS` loaded, any other field is fetched
+    from the database when first accessed.
+    """
+
+    def authenticate_credentials(self, key):
+        values = local_cache.get(key)
+        if values is None:
+            values = cache.get(token_cache_key(key))
+            if values is None:
+                values = self.fetch_user_values(key)
+                cache.set(token_cache_key(key), values, TOKEN_CACHE_TIMEOUT)
+            local_cache.set(key, values)
+
+        user = self.build_user(values)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+
+        return user, Token(key=key, user=user)
+
+    def fetch_user_values(self, key):
+        try:
+            token = Token.objects.select_related("user").get(key=key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_("Invalid token."))
+        return {field: getattr(token.user, field) for field in CACHED_FIELDS}
+
+    def build_user(self, values):
+        # `from_db` expects values in the model's field order and defers the rest
+        field_names = [
+            field.attname
+            for field in CustomUser._meta.concrete_fields
+            if field.attname in values
+        ]
+        return CustomUser.from_db(
+            DEFAULT_DB_ALIAS, field_names, [values[name] for name in field_names]
+        )
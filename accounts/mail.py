@@ -1,17 +1,106 @@
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from huey.contrib import djhuey as huey
+from datetime import timedelta
+from functools import lru_cache
+from smtplib import SMTPException
+
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import OutgoingEmail
 
 SUBJECT = "Confirm Your Account"
+FROM_EMAIL = "noreply@propertyhub.eniola.xyz"
+
+# emails sent over a single SMTP connection
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+# doubled after every failed attempt
+RETRY_BACKOFF = timedelta(seconds=30)
+
+
+@lru_cache(maxsize=None)
+def confirmation_template():
+    return get_template("accounts/mail.html")
 
 
-@huey.task()
 def send_confirmation_email(user):
-    html = render_to_string("accounts/mail.html", {"user": user})
-    send_mail(
-        SUBJECT,
-        message=f"Confirmation Code: {user['confirmation_code']}",
-        from_email="noreply@propertyhub.eniola.xyz",
-        recipient_list=[user["email"]],
-        html_message=html,
+    """
+    Queue the confirmation email of a serialized user, `user["confirmation_code"]`
+    holds the plain code. Delivery is left to `deliver_queued_emails`.
+    """
+    OutgoingEmail.objects.create(
+        recipient=user["email"],
+        subject=SUBJECT,
+        body=f"Confirmation Code: {user['confirmation_code']}",
+        html_body=confirmation_template().render({"user": user}),
+    )
+
+
+def build_message(email, connection):
+    message = EmailMultiAlternatives(
+        email.subject,
+        email.body,
+        FROM_EMAIL,
+        [email.recipient],
+        connection=connection,
     )
+    if email.html_body:
+        message.attach_alternative(email.html_body, "text/html")
+    return message
+
+
+def deliver_batch(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        # skip_locked lets several consumers drain the queue side by side
+        emails = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(attempts__lt=MAX_ATTEMPTS, send_after__lte=now)
+            .order_by("send_after")[:batch_size]
+        )
+        if not emails:
+            return 0, 0
+
+        sent, failed = [], []
+        connection = get_connection()
+        try:
+            connection.open()
+        except (SMTPException, OSError) as error:
+            failed = [(email, error) for email in emails]
+        else:
+            try:
+                for email in emails:
+                    try:
+                        connection.send_messages([build_message(email, connection)])
+                    except (SMTPException, OSError) as error:
+                        failed.append((email, error))
+                    else:
+                        sent.append(email.pk)
+            finally:
+                connection.close()
+
+        OutgoingEmail.objects.filter(pk__in=sent).delete()
+        for email, error in failed:
+            email.attempts += 1
+            email.send_after = now + RETRY_BACKOFF * 2 ** (email.attempts - 1)
+            email.last_error = str(error)
+        OutgoingEmail.objects.bulk_update(
+            [email for email, _ in failed], ["attempts", "send_after", "last_error"]
+        )
+    return len(sent), len(failed)
+
+
+def deliver_queued_emails(batch_size=BATCH_SIZE):
+    """
+    Send every due email, one SMTP connection per batch. Failed emails are retried
+    with exponential backoff and left in the queue after `MAX_ATTEMPTS`.
+    Returns the number of emails sent.
+    """
+    total = 0
+    while True:
+        sent, _ = deliver_batch(batch_size)
+        total += sent
+        # stop on an empty queue, or when the server is refusing everything
+        if not sent:
+            return total
@@ -0,0 +1,57 @@
+# Generated by Django 3.1.3 on 2026-10-18 10:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+import accounts.models
+
+
+def copy_pending_codes(apps, schema_editor):
+    """
+    Keep the codes of accounts that are still waiting for confirmation usable
+    """
+    CustomUser = apps.get_model("accounts", "CustomUser")
+    ConfirmationCode = apps.get_model("accounts", "ConfirmationCode")
+    expires_at = django.utils.timezone.now() + accounts.models.CONFIRMATION_CODE_LIFETIME
+
+    pending = CustomUser.objects.filter(is_confirmed=False).values_list(
+        "id", "email", "confirmation_code"
+    )
+    ConfirmationCode.objects.bulk_create(
+        [
+            ConfirmationCode(
+                user_id=user_id,
+                code_hash=accounts.models.hash_confirmation_code(email, code),
+                expires_at=expires_at,
+            )
+            for user_id, email, code in pending.iterator()
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConfirmationCode',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code_hash', models.CharField(max_length=64, unique=True, verbose_name='code hash')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='expires at')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='confirmation_codes', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(copy_pending_codes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='customuser',
+            name='confirmation_code',
+        ),
+    ]
@@ -1,13 +1,25 @@
-import random
+import secrets
+from datetime import timedelta
 
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
 from django.utils.translation import gettext_lazy as _
 
+CONFIRMATION_CODE_LIFETIME = timedelta(hours=24)
+
 
 def gen_confirmation_code():
-    return random.randrange(100000, 999999)
+    return 100000 + secrets.randbelow(900000)
+
+
+def hash_confirmation_code(email, code):
+    # scoped to the email, so equal codes of different users never collide
+    return salted_hmac(
+        "accounts.ConfirmationCode", f"{email.lower()}:{code}", algorithm="sha256"
+    ).hexdigest()
 
 
 class CustomUserManager(BaseUserManager):
@@ -41,9 +53,6 @@ class CustomUser(AbstractUser):
     is_agent = models.BooleanField(_("is agent"), default=False)
     is_customer = models.BooleanField(_("is customer"), default=False)
     is_confirmed = models.BooleanField(_("is confirmed"), default=False)
-    confirmation_code = models.IntegerField(
-        _("confirmation code"), default=gen_confirmation_code
-    )
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
@@ -66,3 +75,77 @@ class Agent(models.Model):
     agent_display_name = models.CharField(
         _("agent display name"), max_length=150, blank=False, null=False, unique=True
     )
+
+
+class ConfirmationCodeManager(models.Manager):
+    def issue(self, user):
+        """
+        Create a new confirmation code for `user`, replacing any previous one.
+        Only a hash is stored, the plain code is returned to be emailed.
+        """
+        code = gen_confirmation_code()
+        self.filter(user=user).delete()
+        self.create(
+            user=user,
+            code_hash=hash_confirmation_code(user.email, code),
+            expires_at=timezone.now() + CONFIRMATION_CODE_LIFETIME,
+        )
+        return code
+
+    def redeem(self, email, code):
+        """
+        Consume a valid code, returns the user it was issued to or None.
+        """
+        confirmation_code = (
+            self.select_related("user")
+            .filter(
+                code_hash=hash_confirmation_code(email, code),
+                expires_at__gt=timezone.now(),
+            )
+            .first()
+        )
+        if confirmation_code is None:
+            return None
+        confirmation_code.delete()
+        return confirmation_code.user
+
+    def purge_expired(self, batch_size=1000):
+        deleted = 0
+        while True:
+            expired = list(
+                self.filter(expires_at__lte=timezone.now()).values_list(
+                    "pk", flat=True
+                )[:batch_size]
+            )
+            if not expired:
+                return deleted
+            deleted += self.filter(pk__in=expired).delete()[0]
+
+
+class ConfirmationCode(models.Model):
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name="confirmation_codes"
+    )
+    code_hash = models.CharField(_("code hash"), max_length=64, unique=True)
+    expires_at = models.DateTimeField(_("expires at"), db_index=True)
+
+    objects = ConfirmationCodeManager()
+
+
+class OutgoingEmail(models.Model):
+    """
+    Email waiting to be delivered by `accounts.mail.deliver_queued_emails`
+    """
+
+    recipient = models.EmailField(_("recipient"))
+    subject = models.CharField(_("subject"), max_length=255)
+    body = models.TextField(_("body"))
+    html_body = models.TextField(_("html body"), blank=True)
+    attempts = models.PositiveSmallIntegerField(_("attempts"), default=0)
+    send_after = models.DateTimeField(_("send after"), default=timezone.now)
+    last_error = models.TextField(_("last error"), blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["attempts", "send_after"], name="outgoing_email_due_idx")
+        ]
@@ -16,7 +16,6 @@ class UserSerializer(serializers.ModelSerializer):
             "password",
             "image_url",
             "is_customer",
-            "confirmation_code",
             "is_confirmed",
             "is_agent",
             "date_joined",
@@ -27,7 +26,6 @@ class UserSerializer(serializers.ModelSerializer):
             "is_agent": {"read_only": True},
             "is_customer": {"read_only": True},
             "is_confirmed": {"read_only": True},
-            "confirmation_code": {"read_only": True},
         }
 
     def create(self, validated_data):
@@ -56,4 +54,5 @@ class ResendEmailSerializer(serializers.Serializer):
 
 
 class ConfirmAccountSeriailzer(serializers.Serializer):
+    email = serializers.EmailField(required=True)
     confirmation_code = serializers.IntegerField(required=True)
@@ -1,12 +1,26 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 
+from .authentication import invalidate_tokens
 from .models import Agent
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token_and_profile(sender, instance=None, created=False, **kwargs):
     if created:
-        Token.objects.create(user=instance)
\ No newline at end of file
+        Token.objects.create(user=instance)
+
+
+# drop cached token lookups when the cached user flags may have changed
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_tokens(sender, instance=None, created=False, **kwargs):
+    if not created:
+        keys = Token.objects.filter(user=instance).values_list("key", flat=True)
+        invalidate_tokens(*keys)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance=None, **kwargs):
+    invalidate_tokens(instance.key)
@@ -0,0 +1,15 @@
+from huey import crontab
+from huey.contrib import djhuey as huey
+
+from . import mail
+from .models import ConfirmationCode
+
+
+@huey.db_periodic_task(crontab(minute="*/30"))
+def purge_expired_confirmation_codes():
+    ConfirmationCode.objects.purge_expired()
+
+
+@huey.db_periodic_task(crontab())
+def deliver_queued_emails():
+    mail.deliver_queued_emails()
@@ -0,0 +1,254 @@
+import socketserver
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from . import mail
+from .authentication import CachedTokenAuthentication, local_cache
+from .models import ConfirmationCode, CustomUser, OutgoingEmail
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.user = CustomUser.objects.create_user(
+            email="user@test.com",
+            password="password",
+            first_name="Test",
+            last_name="User",
+            is_customer=True,
+            is_confirmed=True,
+        )
+        self.key = self.user.auth_token.key
+
+    def authenticate(self, key=None):
+        request = APIRequestFactory().get(
+            "/", HTTP_AUTHORIZATION=f"Token {key or self.key}"
+        )
+        return CachedTokenAuthentication().authenticate(request)
+
+    def test_repeated_lookups_skip_the_database(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+        local_cache.clear()
+        with self.assertNumQueries(0):
+            user, token = self.authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertTrue(user.is_confirmed)
+        self.assertEqual(token.key, self.key)
+
+    def test_other_fields_are_loaded_lazily(self):
+        user, _ = self.authenticate()
+
+        self.assertEqual(user.email, "user@test.com")
+
+    def test_user_changes_invalidate_the_cache(self):
+        self.authenticate()
+
+        self.user.is_confirmed = False
+        self.user.save()
+        user, _ = self.authenticate()
+        self.assertFalse(user.is_confirmed)
+
+    def test_deleted_token_is_rejected(self):
+        self.authenticate()
+
+        self.user.auth_token.delete()
+        response = self.client.get(
+            reverse("my-profile"), HTTP_AUTHORIZATION=f"Token {self.key}"
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_profile(self):
+        response = self.client.get(
+            reverse("my-profile"), HTTP_AUTHORIZATION=f"Token {self.key}"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["email"], "user@test.com")
+
+
+@mock.patch("accounts.views.send_confirmation_email")
+class ConfirmationCodeTests(TestCase):
+    def register(self, email="new@test.com"):
+        self.client.post(
+            reverse("registration"),
+            {
+                "email": email,
+                "password": "password",
+                "first_name": "New",
+                "last_name": "User",
+            },
+        )
+        return CustomUser.objects.get(email=email)
+
+    def confirm(self, email, code):
+        return self.client.post(
+            reverse("confirm-account"), {"email": email, "confirmation_code": code}
+        )
+
+    def test_only_the_hash_is_stored(self, send_confirmation_email):
+        user = self.register()
+
+        code = send_confirmation_email.call_args[0][0]["confirmation_code"]
+        confirmation_code = ConfirmationCode.objects.get(user=user)
+        self.assertNotIn(str(code), confirmation_code.code_hash)
+        self.assertGreater(confirmation_code.expires_at, timezone.now())
+
+    def test_confirm(self, send_confirmation_email):
+        user = self.register()
+        code = send_confirmation_email.call_args[0][0]["confirmation_code"]
+
+        self.assertEqual(self.confirm("other@test.com", code).status_code, 400)
+        self.assertEqual(self.confirm("new@test.com", code).status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.is_confirmed)
+        # codes are single use
+        self.assertEqual(self.confirm("new@test.com", code).status_code, 400)
+
+    def test_resend_replaces_the_code(self, send_confirmation_email):
+        self.register()
+        old_code = send_confirmation_email.call_args[0][0]["confirmation_code"]
+
+        self.client.post(reverse("resend-confirmation"), {"email": "new@test.com"})
+        code = send_confirmation_email.call_args[0][0]["confirmation_code"]
+
+        self.assertEqual(ConfirmationCode.objects.count(), 1)
+        if old_code != code:
+            self.assertEqual(self.confirm("new@test.com", old_code).status_code, 400)
+        self.assertEqual(self.confirm("new@test.com", code).status_code, 200)
+
+    def test_expired_codes(self, send_confirmation_email):
+        self.register()
+        code = send_confirmation_email.call_args[0][0]["confirmation_code"]
+        ConfirmationCode.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self.confirm("new@test.com", code).status_code, 400)
+        self.assertEqual(ConfirmationCode.objects.purge_expired(), 1)
+        self.assertFalse(ConfirmationCode.objects.exists())
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Just enough SMTP for Django's backend, records every message it accepts
+    """
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 localhost")
+        recipients = []
+        for line in self.rfile:
+            command = line.decode().strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250 localhost")
+            elif command.startswith("RCPT"):
+                recipient = line.decode().strip()[8:].strip("<>")
+                if recipient in self.server.refused:
+                    self.reply("550 mailbox unavailable")
+                    continue
+                recipients.append(recipient)
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                for data_line in self.rfile:
+                    if data_line.rstrip(b"\r\n") == b".":
+                        break
+                    data.append(data_line)
+                self.server.messages.append((recipients, b"".join(data).decode()))
+                recipients = []
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                # MAIL, RSET and NOOP
+                self.reply("250 OK")
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.connections = 0
+        self.messages = []
+        self.refused = set()
+
+
+class EmailQueueTests(TestCase):
+    def setUp(self):
+        self.server = SMTPServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        settings = override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=self.server.server_address[1],
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER="",
+            EMAIL_HOST_PASSWORD="",
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def queue(self, count):
+        for index in range(count):
+            mail.send_confirmation_email(
+                {
+                    "email": f"user{index}@test.com",
+                    "first_name": "Test",
+                    "last_name": "User",
+                    "confirmation_code": 123456,
+                }
+            )
+
+    def test_batches_share_a_connection(self):
+        self.queue(5)
+
+        self.assertEqual(mail.deliver_queued_emails(batch_size=2), 5)
+        self.assertEqual(len(self.server.messages), 5)
+        self.assertEqual(self.server.connections, 3)
+        self.assertFalse(OutgoingEmail.objects.exists())
+
+        recipients, message = self.server.messages[0]
+        self.assertEqual(recipients, ["user0@test.com"])
+        self.assertIn("123456", message)
+        self.assertIn("text/html", message)
+
+    def test_failures_are_retried_with_backoff(self):
+        self.queue(2)
+        self.server.refused.add("user1@test.com")
+
+        self.assertEqual(mail.deliver_queued_emails(), 1)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.recipient, "user1@test.com")
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.send_after, timezone.now())
+
+        # not due yet
+        self.assertEqual(mail.deliver_queued_emails(), 0)
+        self.server.refused.clear()
+        OutgoingEmail.objects.update(send_after=timezone.now())
+        self.assertEqual(mail.deliver_queued_emails(), 1)
+        self.assertFalse(OutgoingEmail.objects.exists())
+
+    def test_unreachable_server(self):
+        self.queue(1)
+        self.server.shutdown()
+        self.server.server_close()
+
+        self.assertEqual(mail.deliver_queued_emails(), 0)
+        self.assertEqual(OutgoingEmail.objects.get().attempts, 1)
@@ -1,11 +1,9 @@
-from smtplib import SMTPException
-
 from rest_framework import generics, status
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.response import Response
 
 from .mail import send_confirmation_email
-from .models import CustomUser
+from .models import ConfirmationCode, CustomUser
 from .permission import CustomIsAuthenticated
 from .serializers import (
     UserSerializer,
@@ -31,9 +29,10 @@ class AgentRegistrationView(generics.CreateAPIView):
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
+        agent = serializer.save()
 
-        send_confirmation_email(serializer.data["user"])()
+        code = ConfirmationCode.objects.issue(agent.user)
+        send_confirmation_email({**serializer.data["user"], "confirmation_code": code})
 
         headers = self.get_success_headers(serializer.data)
         return Response(
@@ -56,10 +55,11 @@ class RegistrationView(generics.CreateAPIView):
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
+        user = serializer.save()
 
         try:
-            send_confirmation_email(serializer.data)
+            code = ConfirmationCode.objects.issue(user)
+            send_confirmation_email({**serializer.data, "confirmation_code": code})
         except Exception:
             return Response(
                 {
@@ -112,23 +112,13 @@ class ResendConfirmationView(generics.GenericAPIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # check if the mail was sent successfully
-        try:
-            send_confirmation_email(serialized_user)
-        except SMTPException:
-            # TODO decide whether to remove the email
-            return Response(
-                {
-                    "detail": "Something went wrong! Please request confirmation code again",
-                    "email": serializer.data["email"],
-                },
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
-        else:
-            return Response(
-                {"detail": "Confirmation code sent to email address successfully"},
-                status=status.HTTP_200_OK,
-            )
+        # the email is queued, delivery failures are retried by the queue consumer
+        code = ConfirmationCode.objects.issue(user)
+        send_confirmation_email({**serialized_user, "confirmation_code": code})
+        return Response(
+            {"detail": "Confirmation code sent to email address successfully"},
+            status=status.HTTP_200_OK,
+        )
 
 
 class ConfirmAccountView(generics.GenericAPIView):
@@ -138,14 +128,13 @@ class ConfirmAccountView(generics.GenericAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        # Handle cases where confirmation code is not attached to an account
-        try:
-            user = CustomUser.objects.get(
-                confirmation_code=serializer.data["confirmation_code"]
-            )
-        except CustomUser.DoesNotExist:
+        # Handle cases where the code is wrong, expired or already used
+        user = ConfirmationCode.objects.redeem(
+            serializer.data["email"], serializer.data["confirmation_code"]
+        )
+        if user is None:
             return Response(
-                {"detail": "User account does not exist"},
+                {"detail": "Invalid or expired confirmation code"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
@@ -158,7 +147,7 @@ class ConfirmAccountView(generics.GenericAPIView):
 
         # confirm account
         user.is_confirmed = True
-        user.save()
+        user.save(update_fields=["is_confirmed"])
 
         return Response(
             {"detail": "Account confirmed successfully!"}, status=status.HTTP_200_OK
@@ -181,9 +170,11 @@ class ProfileView(generics.GenericAPIView):
         return self.serializer_class
 
     def get(self, request, *args, **kwargs):
-        if not self.request.user.is_agent:
-            serializer = self.get_serializer(instance=request.user)
+        # request.user only carries the fields cached by the authentication class
+        user = CustomUser.objects.select_related("agent").get(pk=request.user.pk)
+        if not user.is_agent:
+            serializer = self.get_serializer(instance=user)
             return Response(serializer.data, status=status.HTTP_200_OK)
         else:
-            serializer = self.get_serializer(instance=request.user.agent)
+            serializer = self.get_serializer(instance=user.agent)
             return Response(serializer.data, status=status.HTTP_200_OK)
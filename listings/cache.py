@@ -0,0 +1,194 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+
+# bumped whenever a listing is saved or deleted, every search cache key embeds it
+GENERATION_KEY = "listings:generation"
+
+SEARCH_CACHE_TIMEOUT = 60 * 5
+SAVED_IDS_CACHE_TIMEOUT = 60 * 60
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+DETAIL_CACHE_TIMEOUT = 60 * 10
+# bump when the serialized shape of a listing changes
+FRAGMENT_FORMAT = 2
+
+# how long past its freshness an entry may still be served while it's rebuilt
+STALE_TIMEOUT = 60 * 60
+# a rebuild holding the lock longer than this is assumed dead
+LOCK_TIMEOUT = 10
+# how long a cold miss waits for another worker's rebuild before doing its own
+LOCK_WAIT = 5
+LOCK_POLL_INTERVAL = 0.05
+SEARCH_HITS_KEY = "listings:search:hits"
+SEARCH_MISSES_KEY = "listings:search:misses"
+
+
+def incr(key, delta=1):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # the key expired or was evicted
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key, delta)
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # seeded from the clock so an evicted counter can never come back lower
+        # than a generation that old entries were stored under
+        cache.add(GENERATION_KEY, int(time.time() * 1000), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    if cache.get(GENERATION_KEY) is None:
+        get_generation()
+    incr(GENERATION_KEY)
+
+
+def normalize_query(search_text):
+    return " ".join(search_text.lower().split())
+
+
+def search_key(search_text, generation):
+    digest = hashlib.md5(normalize_query(search_text).encode()).hexdigest()
+    return f"listings:search:{generation}:{digest}"
+
+
+def single_flight(key, compute, timeout, version=None):
+    """
+    Cached value of `key`, with stale-while-revalidate and single flight rebuilds.
+
+    Entries are `(value, fresh_until, version)` and outlive their freshness by
+    `STALE_TIMEOUT`. An entry that expired or was built from another `version` is
+    rebuilt by the one worker that wins the lock, the others keep serving it.
+    On a cold miss the losers wait for the winner's value instead.
+
+    Returns `(value, is_stale)`.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, fresh_until, entry_version = entry
+        if entry_version == version and fresh_until > time.time():
+            return value, False
+
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            value = compute()
+            cache.set(
+                key, (value, time.time() + timeout, version), timeout + STALE_TIMEOUT
+            )
+            return value, False
+        finally:
+            cache.delete(lock_key)
+
+    if entry is not None:
+        return entry[0], True
+
+    deadline = time.time() + LOCK_WAIT
+    while time.time() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None and entry[2] == version:
+            return entry[0], False
+    # the rebuild is taking too long, don't keep the request waiting
+    return compute(), False
+
+
+def get_search_results(search_text, compute):
+    """
+    Ranked `(rank, id)` rows for a search, ordered best first. Only ids are
+    cached, rendering the page is left to the caller. `compute` is called on a miss.
+    """
+    rebuilt = []
+
+    def rebuild():
+        rebuilt.append(True)
+        return [tuple(row) for row in compute()]
+
+    key = search_key(search_text, get_generation())
+    results, _ = single_flight(key, rebuild, SEARCH_CACHE_TIMEOUT)
+    incr(SEARCH_MISSES_KEY if rebuilt else SEARCH_HITS_KEY)
+    return results
+
+
+def get_search_stats():
+    hits = cache.get(SEARCH_HITS_KEY, 0)
+    misses = cache.get(SEARCH_MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / total if total else None,
+        "generation": get_generation(),
+    }
+
+
+def saved_ids_key(user_id):
+    return f"listings:saved-ids:{user_id}"
+
+
+def get_saved_ids(user_id, compute):
+    """
+    Ids of the listings a user saved, `compute` is called on a miss
+    """
+    key = saved_ids_key(user_id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = sorted(compute())
+        cache.set(key, ids, SAVED_IDS_CACHE_TIMEOUT)
+    return ids
+
+
+def invalidate_saved_ids(*user_ids):
+    cache.delete_many([saved_ids_key(user_id) for user_id in user_ids])
+
+
+def fragment_key(listing, variant=""):
+    # updated_on is bumped on any change to the listing, so it doubles as a version
+    return (
+        f"listings:fragment:{FRAGMENT_FORMAT}:{variant}:{listing.pk}:"
+        f"{listing.updated_on.timestamp()}"
+    )
+
+
+def fields_variant(fields):
+    """
+    Fragment variant of a sparse fieldset
+    """
+    return hashlib.md5(",".join(fields).encode()).hexdigest()[:12]
+
+
+def get_fragments(listings, render, variant=""):
+    """
+    Serialized listings, read from the cache with a single `get_many`. `render` is
+    called once with every listing that missed, and returns their representations.
+    Each `variant`, e.g a sparse fieldset, is cached separately.
+    """
+    keys = [fragment_key(listing, variant) for listing in listings]
+    fragments = cache.get_many(keys)
+
+    missing = [
+        (key, listing) for key, listing in zip(keys, listings) if key not in fragments
+    ]
+    if missing:
+        rendered = render([listing for _, listing in missing])
+        fresh = {key: data for (key, _), data in zip(missing, rendered)}
+        cache.set_many(fresh, FRAGMENT_CACHE_TIMEOUT)
+        fragments.update(fresh)
+
+    return [fragments[key] for key in keys]
+
+
+def get_listing_detail(pk, version, compute):
+    """
+    Serialized listing for the detail view, see `single_flight`. A stale value
+    may belong to an older version of the listing.
+    """
+    return single_flight(
+        f"listings:detail:{FRAGMENT_FORMAT}:{pk}", compute, DETAIL_CACHE_TIMEOUT, version
+    )
@@ -0,0 +1,113 @@
+import csv
+import json
+from datetime import datetime
+
+from django.contrib.postgres.fields import ArrayField
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models import F, OuterRef, Subquery
+
+from .models import IMAGE_BASE_URL, ListingImage
+
+# rows read from the server-side cursor at a time
+CHUNK_SIZE = 2000
+
+EXPORT_FIELDS = (
+    "id",
+    "name",
+    "description",
+    "location",
+    "price",
+    "is_new",
+    "is_furnished",
+    "bedrooms",
+    "bathrooms",
+    "lounges",
+    "like_count",
+    "created_on",
+    "updated_on",
+    "agent_display_name",
+    "image_urls",
+)
+
+
+class Array(Subquery):
+    """
+    A subquery's single column collected into a Postgres array
+    """
+
+    template = "ARRAY(%(subquery)s)"
+
+    def __init__(self, queryset, base_field, **kwargs):
+        super().__init__(queryset, output_field=ArrayField(base_field), **kwargs)
+
+
+def export_rows(queryset):
+    """
+    Listings of `queryset` as dicts of `EXPORT_FIELDS`, streamed from a server
+    side cursor. Agents and images come from the same query.
+    """
+    images = (
+        ListingImage.objects.ready()
+        .filter(listing_id=OuterRef("pk"))
+        .order_by("id")
+        .values("image_file")
+    )
+    rows = (
+        queryset.order_by("id")
+        .annotate(
+            agent_display_name=F("agent__agent_display_name"),
+            image_files=Array(images, models.CharField()),
+        )
+        .values(*EXPORT_FIELDS[:-1], "image_files")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+    to_resource = ListingImage._meta.get_field("image_file").to_python
+    for row in rows:
+        row["image_urls"] = [
+            f"{IMAGE_BASE_URL}{to_resource(image)}" for image in row.pop("image_files")
+        ]
+        yield row
+
+
+def batched(lines, size=CHUNK_SIZE):
+    # one write per batch instead of one per row
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == size:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        # image urls never contain spaces
+        row["image_urls"] = " ".join(row["image_urls"])
+        yield writer.writerow(
+            [
+                row[field].isoformat() if isinstance(row[field], datetime) else row[field]
+                for field in EXPORT_FIELDS
+            ]
+        )
+
+
+FORMATS = {
+    "ndjson": (ndjson_lines, "application/x-ndjson"),
+    "csv": (csv_lines, "text/csv"),
+}
@@ -0,0 +1,188 @@
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+# value clients send when they don't want a filter applied
+ANY = "Any"
+
+
+class Filter:
+    """
+    A single query parameter (or family of parameters) mapped onto a model field.
+    Subclasses turn the raw parameters into a `Q` object, or None when the filter
+    was not requested.
+    """
+
+    def __init__(self, field=None):
+        self.field = field
+
+    def bind(self, name):
+        self.name = name
+        self.field = self.field or name
+
+    def get_value(self, params, param):
+        value = params.get(param)
+        if value in (None, "", ANY):
+            return None
+        return value
+
+    def cast(self, param, value, to=int):
+        try:
+            return to(value)
+        except (TypeError, ValueError):
+            raise ValidationError({param: f"'{value}' is not a valid value."})
+
+    def to_q(self, params):
+        raise NotImplementedError
+
+
+class ExactFilter(Filter):
+    def __init__(self, field=None, to=int):
+        super().__init__(field)
+        self.to = to
+
+    def to_q(self, params):
+        value = self.get_value(params, self.name)
+        if value is None:
+            return None
+        return Q(**{self.field: self.cast(self.name, value, self.to)})
+
+
+class BooleanFilter(ExactFilter):
+    truthy = ("1", "true", "True")
+    falsy = ("0", "false", "False")
+
+    def __init__(self, field=None):
+        super().__init__(field, to=self.to_bool)
+
+    def to_bool(self, value):
+        if value in self.truthy:
+            return True
+        if value in self.falsy:
+            return False
+        raise ValueError(value)
+
+
+class RangeFilter(Filter):
+    """`<field>_min` and `<field>_max`, both inclusive."""
+
+    def to_q(self, params):
+        q = Q()
+        for suffix, lookup in (("min", "gte"), ("max", "lte")):
+            param = f"{self.field}_{suffix}"
+            value = self.get_value(params, param)
+            if value is not None:
+                q &= Q(**{f"{self.field}__{lookup}": self.cast(param, value)})
+        return q or None
+
+
+class InFilter(Filter):
+    """`<field>_in=1,2,3`"""
+
+    def to_q(self, params):
+        param = f"{self.field}_in"
+        value = self.get_value(params, param)
+        if value is None:
+            return None
+        values = {
+            self.cast(param, item.strip()) for item in value.split(",") if item.strip()
+        }
+        if not values:
+            # e.g bedrooms_in=, is as good as not passing it
+            return None
+        return Q(**{f"{self.field}__in": sorted(values)})
+
+
+class CappedFilter(Filter):
+    """
+    The single value filters the clients already send: values below `cap` mean
+    "at most", and `cap` itself (or anything above it) means "one less or more",
+    as documented on the listings endpoint.
+    e.g bedrooms=3 gives <= 3 bedrooms and bedrooms=5 gives 4+ bedrooms
+    """
+
+    def __init__(self, cap, field=None):
+        super().__init__(field)
+        self.cap = cap
+
+    def to_q(self, params):
+        value = self.get_value(params, self.name)
+        if value is None:
+            return None
+        value = self.cast(self.name, value)
+        if value >= self.cap:
+            return Q(**{f"{self.field}__gte": value - 1})
+        return Q(**{f"{self.field}__lte": value})
+
+
+class PrefixFilter(Filter):
+    def to_q(self, params):
+        value = self.get_value(params, self.name)
+        if value is None:
+            return None
+        return Q(**{f"{self.field}__istartswith": value.strip()})
+
+
+class FilterSet:
+    """
+    Declarative set of filters. Every requested filter is AND-ed into a single
+    `.filter()` call, so the result is always one SQL query.
+    """
+
+    ordering_param = "ordering"
+    ordering_fields = ()
+    default_ordering = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.filters = {}
+        for klass in reversed(cls.__mro__):
+            for name, value in vars(klass).items():
+                if isinstance(value, Filter):
+                    value.bind(name)
+                    cls.filters[name] = value
+
+    def __init__(self, params):
+        self.params = params
+
+    def get_q(self):
+        q = Q()
+        for f in self.filters.values():
+            condition = f.to_q(self.params)
+            if condition is not None:
+                q &= condition
+        return q
+
+    def filter_queryset(self, queryset):
+        return queryset.filter(self.get_q())
+
+    def get_ordering(self):
+        """
+        Ordering requested through `?ordering=`, always ending in `id` so it can
+        be used as a keyset.
+        """
+        ordering = self.params.get(self.ordering_param)
+        if not ordering:
+            return self.default_ordering
+        if ordering.lstrip("-") not in self.ordering_fields:
+            raise ValidationError(
+                {self.ordering_param: f"Cannot order by '{ordering}'."}
+            )
+        return ordering, "-id" if ordering.startswith("-") else "id"
+
+
+class ListingFilter(FilterSet):
+    price = CappedFilter(cap=1000001)
+    bedrooms = CappedFilter(cap=5)
+    bathrooms = CappedFilter(cap=5)
+    is_furnished = BooleanFilter()
+    is_new = BooleanFilter()
+    location = PrefixFilter()
+
+    price_range = RangeFilter("price")
+    bedrooms_range = RangeFilter("bedrooms")
+    bathrooms_range = RangeFilter("bathrooms")
+    bedrooms_set = InFilter("bedrooms")
+    bathrooms_set = InFilter("bathrooms")
+
+    ordering_fields = ("created_on", "price")
+    default_ordering = ("-created_on", "-id")
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from listings.models import Listing, SEARCH_VECTOR
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute Listing.search_vector for existing rows in primary key chunks. "
+        "New and edited listings are kept up to date by a database trigger."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        # every row by default, vectors from before the location was weighted in
+        # are stale but not null
+        parser.add_argument(
+            "--missing-only",
+            action="store_true",
+            help="Only fill rows without a vector instead of recomputing every row.",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        queryset = Listing.objects.all()
+        if options["missing_only"]:
+            queryset = queryset.filter(search_vector__isnull=True)
+
+        bounds = queryset.aggregate(first=Min("pk"), last=Max("pk"))
+        if bounds["first"] is None:
+            self.stdout.write("Nothing to backfill.")
+            return
+
+        updated = 0
+        # each chunk is its own short UPDATE so no long lock is held on the table
+        for start in range(bounds["first"], bounds["last"] + 1, chunk_size):
+            updated += queryset.filter(
+                pk__gte=start, pk__lt=start + chunk_size
+            ).update(search_vector=SEARCH_VECTOR)
+            self.stdout.write(f"Backfilled {updated} listings (up to id {start + chunk_size - 1})")
+
+        self.stdout.write(self.style.SUCCESS(f"Done, {updated} listings updated."))
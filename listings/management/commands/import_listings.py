@@ -0,0 +1,204 @@
+import csv
+import json
+import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts.models import Agent
+from listings.cache import bump_generation
+from listings.models import Listing, ListingImage
+from listings.tasks import upload_listing_images
+
+REQUIRED_FIELDS = ("name", "description", "location", "price", "agent_display_name")
+INTEGER_FIELDS = ("price", "bedrooms", "bathrooms", "lounges")
+BOOLEAN_FIELDS = ("is_new", "is_furnished")
+TRUE_VALUES = ("1", "true", "yes")
+
+
+class InvalidRow(Exception):
+    pass
+
+
+def parse_row(row):
+    """
+    Listing fields, agent display name and image urls of a CSV or NDJSON row.
+    Columns the export adds (id, like_count, dates) are ignored.
+    NDJSON rows are passed undecoded, so a bad line only skips that row.
+    """
+    if isinstance(row, str):
+        try:
+            row = json.loads(row)
+        except json.JSONDecodeError as error:
+            raise InvalidRow(f"invalid JSON, {error}")
+    if not isinstance(row, dict):
+        raise InvalidRow("not a JSON object")
+
+    missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, "")]
+    if missing:
+        raise InvalidRow(f"missing {', '.join(missing)}")
+
+    fields = {
+        "name": str(row["name"]),
+        "description": str(row["description"]),
+        "location": str(row["location"]),
+    }
+    for field in INTEGER_FIELDS:
+        if row.get(field) not in (None, ""):
+            try:
+                fields[field] = int(row[field])
+            except (TypeError, ValueError):
+                raise InvalidRow(f"{field} must be a whole number")
+    for field in BOOLEAN_FIELDS:
+        if row.get(field) not in (None, ""):
+            fields[field] = str(row[field]).lower() in TRUE_VALUES
+
+    # lengths and integer ranges, a single bad value would otherwise abort the
+    # chunk's INSERT and the whole import with it
+    try:
+        Listing(**fields).clean_fields(exclude=["agent", "search_vector"])
+    except ValidationError as error:
+        raise InvalidRow(describe(error))
+
+    image_urls = row.get("image_urls") or []
+    if isinstance(image_urls, str):
+        # space separated in CSV, as written by the export
+        image_urls = image_urls.split()
+    if not isinstance(image_urls, list):
+        raise InvalidRow("image_urls must be a list")
+    source_url = ListingImage._meta.get_field("source_url")
+    for url in image_urls:
+        try:
+            source_url.clean(url, None)
+        except ValidationError as error:
+            raise InvalidRow(describe(error))
+    return fields, str(row["agent_display_name"]), image_urls
+
+
+def describe(error):
+    if not hasattr(error, "error_dict"):
+        return "; ".join(error.messages)
+    return "; ".join(
+        f"{field}: {message}"
+        for field, messages in error.message_dict.items()
+        for message in messages
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import listings from a CSV or NDJSON file, e.g one written by the "
+        "listings export. Rows name their agent by agent_display_name and may "
+        "carry image_urls, which are uploaded in the background."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format",
+            choices=("csv", "ndjson"),
+            help="Defaults to the file extension.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def read_rows(self, file, file_format):
+        if file_format == "csv":
+            yield from csv.DictReader(file)
+            return
+        for line in file:
+            if line.strip():
+                yield line
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or path.rsplit(".", 1)[-1].lower()
+        if file_format not in ("csv", "ndjson"):
+            raise CommandError("Pass --format, the file extension isn't csv or ndjson.")
+
+        try:
+            file = open(path, newline="", encoding="utf-8")
+        except OSError as error:
+            raise CommandError(f"Can't read {path}: {error.strerror}")
+        with file:
+            self.import_rows(file, file_format, options["chunk_size"])
+
+    def import_rows(self, file, file_format, chunk_size):
+        rows = enumerate(self.read_rows(file, file_format), start=1)
+        imported = skipped = 0
+        started = time.monotonic()
+
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            created, errors = self.import_chunk(chunk)
+            for line, error in errors:
+                self.stderr.write(f"Row {line} skipped: {error}")
+            imported += created
+            skipped += len(errors)
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"Imported {imported} listings ({imported / elapsed:.0f} rows/sec)"
+            )
+
+        if imported:
+            # bulk_create skips the post_save receiver that expires search results
+            bump_generation()
+
+        elapsed = time.monotonic() - started
+        rate = imported / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done, {imported} listings imported and {skipped} skipped "
+                f"in {elapsed:.1f}s ({rate:.0f} rows/sec)."
+            )
+        )
+
+    def import_chunk(self, chunk):
+        parsed, errors = [], []
+        for line, row in chunk:
+            try:
+                parsed.append((line, *parse_row(row)))
+            except InvalidRow as error:
+                errors.append((line, error))
+
+        # one query for every agent named in the chunk
+        agent_ids = dict(
+            Agent.objects.filter(
+                agent_display_name__in={name for _, _, name, _ in parsed}
+            ).values_list("agent_display_name", "user_id")
+        )
+
+        listings, image_urls = [], []
+        for line, fields, agent_name, urls in parsed:
+            if agent_name not in agent_ids:
+                errors.append((line, f"no agent named {agent_name!r}"))
+                continue
+            listings.append(Listing(agent_id=agent_ids[agent_name], **fields))
+            image_urls.append(urls)
+
+        with transaction.atomic():
+            # search_vector is filled by the insert trigger, in the same statement
+            Listing.objects.bulk_create(listings)
+            ListingImage.objects.bulk_create(
+                [
+                    ListingImage(
+                        listing=listing,
+                        status=ListingImage.Status.PENDING,
+                        source_url=url,
+                    )
+                    for listing, urls in zip(listings, image_urls)
+                    for url in urls
+                ]
+            )
+            for listing, urls in zip(listings, image_urls):
+                if urls:
+                    transaction.on_commit(
+                        lambda pk=listing.pk: upload_listing_images(pk)
+                    )
+
+        errors.sort(key=lambda error: error[0])
+        return len(listings), errors
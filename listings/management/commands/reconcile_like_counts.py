@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from listings.models import Listing
+
+
+class Command(BaseCommand):
+    help = (
+        "Repair Listing.like_count where it drifted from the likes table, "
+        "e.g after raw SQL edits or a listing saved with a stale like_count."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Only report the drift."
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        repaired = 0
+        last_pk = 0
+
+        while True:
+            drifted = list(
+                Listing.objects.with_like_count_drift()
+                .filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", "like_count", "actual_likes")[:batch_size]
+            )
+            if not drifted:
+                break
+
+            for pk, like_count, actual_likes in drifted:
+                self.stdout.write(
+                    f"Listing {pk}: like_count={like_count}, likes={actual_likes}"
+                )
+            if not options["dry_run"]:
+                # recounted in the UPDATE itself so likes added meanwhile aren't lost
+                Listing.objects.filter(pk__in=[row[0] for row in drifted]).recount_likes()
+            repaired += len(drifted)
+            last_pk = drifted[-1][0]
+
+        verb = "found" if options["dry_run"] else "repaired"
+        self.stdout.write(self.style.SUCCESS(f"{repaired} listings {verb}."))
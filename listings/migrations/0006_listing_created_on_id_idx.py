@@ -0,0 +1,17 @@
+# Generated by Django 3.1.3 on 2026-10-18 10:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_listing_is_furnished'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['created_on', 'id'], name='listing_created_on_id_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.1.3 on 2026-10-18 10:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0006_listing_created_on_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['price', 'bedrooms'], name='listing_price_bedrooms_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(is_furnished=True), fields=['created_on', 'id'], name='listing_furnished_created_idx'),
+        ),
+        # `location__istartswith` compiles to UPPER("location"::text) LIKE UPPER('x%'),
+        # which only a pattern_ops index on the same expression can serve
+        migrations.RunSQL(
+            sql='CREATE INDEX listing_location_prefix_idx ON listings_listing (UPPER("location"::text) text_pattern_ops);',
+            reverse_sql="DROP INDEX listing_location_prefix_idx;",
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.1.3 on 2026-10-18 10:45
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+# keep the weights in sync with `listings.models.SEARCH_VECTOR`
+CREATE_TRIGGER = """
+CREATE FUNCTION listings_listing_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', COALESCE(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('english', COALESCE(NEW.description, '')), 'B') ||
+        setweight(to_tsvector('english', COALESCE(NEW.location, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER listings_listing_search_vector_update
+BEFORE INSERT OR UPDATE OF name, description, location ON listings_listing
+FOR EACH ROW EXECUTE PROCEDURE listings_listing_search_vector_trigger();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER listings_listing_search_vector_update ON listings_listing;
+DROP FUNCTION listings_listing_search_vector_trigger();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0007_listing_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=CREATE_TRIGGER, reverse_sql=DROP_TRIGGER),
+        migrations.AddIndex(
+            model_name='listing',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='listing_search_vector_idx'),
+        ),
+    ]
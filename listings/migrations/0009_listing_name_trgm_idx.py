@@ -0,0 +1,18 @@
+# Generated by Django 3.1.3 on 2026-10-18 10:45
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0008_listing_search_vector_trigger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='listing_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.3 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0009_listing_name_trgm_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='like_count',
+            field=models.IntegerField(default=0, verbose_name='like count'),
+        ),
+        migrations.RunSQL(
+            sql="""
+            UPDATE listings_listing SET like_count = likes.count
+            FROM (
+                SELECT listing_id, COUNT(*) AS count FROM listings_listing_likes
+                GROUP BY listing_id
+            ) AS likes
+            WHERE likes.listing_id = listings_listing.id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 3.1.3 on 2026-10-18 10:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+BATCH_SIZE = 5000
+
+
+def copy_likes(apps, schema_editor):
+    """
+    Copy the auto-created likes join table into SavedListing in id batches. The
+    save time of existing likes is unknown, so they get the migration time.
+    """
+    Listing = apps.get_model("listings", "Listing")
+    SavedListing = apps.get_model("listings", "SavedListing")
+    Like = Listing.likes.through
+    saved_at = django.utils.timezone.now()
+
+    last_id = 0
+    while True:
+        batch = list(
+            Like.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "customuser_id", "listing_id")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        SavedListing.objects.bulk_create(
+            [
+                SavedListing(user_id=user_id, listing_id=listing_id, saved_at=saved_at)
+                for _, user_id, listing_id in batch
+            ],
+            ignore_conflicts=True,
+        )
+        last_id = batch[-1][0]
+
+
+def copy_saved_listings(apps, schema_editor):
+    Listing = apps.get_model("listings", "Listing")
+    SavedListing = apps.get_model("listings", "SavedListing")
+    Like = Listing.likes.through
+
+    last_id = 0
+    while True:
+        batch = list(
+            SavedListing.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "user_id", "listing_id")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        Like.objects.bulk_create(
+            [
+                Like(customuser_id=user_id, listing_id=listing_id)
+                for _, user_id, listing_id in batch
+            ]
+        )
+        last_id = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('listings', '0010_listing_like_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SavedListing',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('saved_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='saved at')),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saves', to='listings.listing')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saved_listings', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='savedlisting',
+            constraint=models.UniqueConstraint(fields=('user', 'listing'), name='saved_listing_user_listing_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='savedlisting',
+            index=models.Index(fields=['user', '-saved_at'], name='saved_listing_user_saved_idx'),
+        ),
+        migrations.RunPython(copy_likes, copy_saved_listings),
+        # swap the auto-created join table for SavedListing
+        migrations.RemoveField(
+            model_name='listing',
+            name='likes',
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='likes',
+            field=models.ManyToManyField(related_name='listing_likes', through='listings.SavedListing', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.3 on 2026-10-18 10:52
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0011_savedlisting'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='updated_on',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='updated_on'),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(
+            sql="UPDATE listings_listing SET updated_on = created_on;",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['updated_on', 'id'], name='listing_updated_on_id_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.3 on 2026-10-18 10:58
+
+import cloudinary.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0012_listing_updated_on'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listingimage',
+            name='spool_name',
+            field=models.CharField(blank=True, max_length=255, verbose_name='spool name'),
+        ),
+        migrations.AddField(
+            model_name='listingimage',
+            name='status',
+            field=models.CharField(choices=[('pending', 'pending'), ('ready', 'ready'), ('failed', 'failed')], default='ready', max_length=10, verbose_name='status'),
+        ),
+        migrations.AlterField(
+            model_name='listingimage',
+            name='image_file',
+            field=cloudinary.models.CloudinaryField(max_length=255, null=True, verbose_name='image'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.1.3 on 2026-10-18 11:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0013_listingimage_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDeletion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('public_id', models.CharField(max_length=255, verbose_name='public id')),
+                ('created_on', models.DateTimeField(auto_now_add=True, verbose_name='created_on')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='attempts')),
+            ],
+        ),
+    ]
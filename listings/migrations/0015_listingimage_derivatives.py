@@ -0,0 +1,18 @@
+# Generated by Django 3.1.3 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0014_imagedeletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listingimage',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict, verbose_name='derivatives'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.1.3 on 2026-10-18 11:06
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0015_listingimage_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingTombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing_id', models.IntegerField(verbose_name='listing id')),
+                ('deleted_on', models.DateTimeField(default=django.utils.timezone.now, verbose_name='deleted on')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='listingtombstone',
+            index=models.Index(fields=['deleted_on', 'listing_id'], name='tombstone_deleted_on_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.3 on 2026-10-18 11:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0016_listingtombstone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listingimage',
+            name='source_url',
+            field=models.URLField(blank=True, max_length=500, verbose_name='source url'),
+        ),
+    ]
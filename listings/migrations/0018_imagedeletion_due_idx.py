@@ -0,0 +1,17 @@
+# Generated by Django 3.1.3 on 2026-10-18 11:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0017_listingimage_source_url'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='imagedeletion',
+            index=models.Index(fields=['attempts', 'id'], name='image_deletion_due_idx'),
+        ),
+    ]
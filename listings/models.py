@@ -1,6 +1,6 @@
 import cloudinary
 from cloudinary.models import CloudinaryField
-from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import (
     SearchVector,
     SearchQuery,
@@ -8,34 +8,139 @@ from django.contrib.postgres.search import (
     TrigramSimilarity,
     SearchVectorField,
 )
-from django.db import models
-from django.db.models.signals import pre_delete, post_save
+from django.db import connection, models, transaction
+from django.db.models import Count, Exists, F, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from accounts.models import Agent, CustomUser
+from .cache import bump_generation, invalidate_saved_ids
 
 
-class ListingManager(models.Manager):
-    # an attempt of making things nice
-    def search(self, search_text):
-        search_vectors = SearchVector(
-            "name", weight="A", config="english"
-        ) + SearchVector(
-            StringAgg("description", delimiter=" "), weight="B", config="english"
+SEARCH_VECTOR = (
+    SearchVector("name", weight="A", config="english")
+    + SearchVector("description", weight="B", config="english")
+    + SearchVector("location", weight="C", config="english")
+)
+
+# upper bound on how many matches get ranked for a single search
+SEARCH_CANDIDATE_LIMIT = 1000
+
+IMAGE_BASE_URL = "https://res.cloudinary.com/dybhjquqy/"
+
+# resized WebP copies of every listing image, generated by Cloudinary at upload
+IMAGE_DERIVATIVES = {
+    "thumb": {"width": 320, "height": 240, "crop": "fill"},
+    "card": {"width": 800, "height": 600, "crop": "fill"},
+    "full": {"width": 1600, "crop": "limit"},
+}
+
+
+def derivative_transformation(name):
+    return {**IMAGE_DERIVATIVES[name], "quality": "auto", "format": "webp"}
+
+
+def listing_prefetches(fields=None, include_agent=True):
+    """
+    Lookups for `prefetch_related_objects` that cover everything `ListingSerializer`
+    renders, or only the relations among `fields` when given
+    """
+    prefetches = []
+    if include_agent and (fields is None or "agent" in fields):
+        prefetches.append("agent__user")
+    if fields is None or "listing_images" in fields:
+        prefetches.append(Prefetch("images", queryset=ListingImage.objects.ready()))
+    if fields is None or "reviews" in fields:
+        prefetches.append(
+            Prefetch("reviews", queryset=Review.objects.select_related("user"))
+        )
+    return prefetches
+
+
+def counted_likes():
+    likes = (
+        Listing.likes.through.objects.filter(listing_id=OuterRef("pk"))
+        .order_by()
+        .values("listing_id")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    return Coalesce(Subquery(likes), 0)
+
+
+class ListingQuerySet(models.QuerySet):
+    def with_related(self):
+        """
+        Fetch everything `ListingSerializer` renders in a fixed number of queries,
+        no matter how many listings are in the page.
+        """
+        return (
+            self.for_list()
+            .select_related("agent__user")
+            .prefetch_related(*listing_prefetches(include_agent=False))
         )
+
+    def for_list(self):
+        """
+        Bare listing rows for list views. Related objects are only fetched by
+        `ListingSerializer` for listings missing from the fragment cache.
+        """
+        return self.defer("search_vector")
+
+    def with_like_count_drift(self):
+        """
+        Listings whose `like_count` doesn't match the rows in the `likes` table
+        """
+        return self.annotate(actual_likes=counted_likes()).exclude(
+            like_count=F("actual_likes")
+        )
+
+    def recount_likes(self):
+        return self.update(like_count=counted_likes())
+
+    def touch(self):
+        return self.update(updated_on=timezone.now())
+
+    def search(self, search_text):
+        """
+        Two phase search: an index-backed filter (GIN on `search_vector`) keeps the
+        best `SEARCH_CANDIDATE_LIMIT` matches by the cheaper `ts_rank`, and only
+        those are ranked with `ts_rank_cd` over the stored vector plus the name's
+        trigram similarity. Names are only fuzzy matched (trigram GIN on `name`)
+        when nothing matches the text, e.g for typos.
+        """
         search_query = SearchQuery(search_text, config="english")
-        search_rank = SearchRank(search_vectors, search_query)
+        matches = self.filter(search_vector=search_query)
+        # ordered down to the id, the cut is the same on every run
+        candidate_rank = SearchRank(F("search_vector"), search_query)
+        best_matches = (
+            matches.annotate(candidate_rank=candidate_rank)
+            .order_by("-candidate_rank", "-pk")
+            .values("pk")[:SEARCH_CANDIDATE_LIMIT]
+        )
         trigram_similarity = TrigramSimilarity("name", search_text)
+        similar_names = (
+            self.filter(~Exists(matches), name__trigram_similar=search_text)
+            .annotate(similarity=trigram_similarity)
+            .order_by("-similarity", "-pk")
+            .values("pk")[:SEARCH_CANDIDATE_LIMIT]
+        )
+        search_rank = SearchRank(F("search_vector"), search_query, cover_density=True)
         qs = (
-            self.get_queryset()
-                .filter(search_vector=search_query)
-                .annotate(rank=search_rank + trigram_similarity)
-                .order_by("-rank")
+            self.filter(pk__in=best_matches.union(similar_names))
+            .annotate(rank=search_rank + trigram_similarity)
+            .order_by("-rank", "-id")
         )
         return qs
 
 
+class ListingManager(models.Manager.from_queryset(ListingQuerySet)):
+    pass
+
+
 class Listing(models.Model):
     agent = models.ForeignKey(
         Agent, on_delete=models.CASCADE, related_name="listings", null=False
@@ -48,31 +153,251 @@ class Listing(models.Model):
     price = models.IntegerField(_("price"), null=False, blank=False)
     is_new = models.BooleanField(_("is_new"), default=False)
     is_furnished = models.BooleanField(_("is furnished"), default=False)
-    likes = models.ManyToManyField(CustomUser, related_name="listing_likes")
+    likes = models.ManyToManyField(
+        CustomUser, related_name="listing_likes", through="SavedListing"
+    )
+    # denormalized count of `likes`, kept in step by `update_like_count`
+    like_count = models.IntegerField(_("like count"), default=0)
     bedrooms = models.IntegerField(_("bedrooms"), default=0)
     bathrooms = models.IntegerField(_("bathrooms"), default=0)
     lounges = models.IntegerField(_("lounges"), default=0)
     created_on = models.DateTimeField(_("created_on"), auto_now_add=True)
+    # also bumped by `touch_listing` when images, reviews or likes change
+    updated_on = models.DateTimeField(_("updated_on"), auto_now=True)
 
+    # maintained by the `listings_listing_search_vector_update` trigger, see
+    # migration 0008. `SEARCH_VECTOR` is the same expression for set-wise updates.
     search_vector = SearchVectorField(null=True)
 
     objects = ListingManager()
 
+    class Meta:
+        indexes = [
+            # backs keyset pagination on (created_on, id)
+            models.Index(fields=["created_on", "id"], name="listing_created_on_id_idx"),
+            models.Index(fields=["updated_on", "id"], name="listing_updated_on_id_idx"),
+            # back the structured filters in `listings.filters.ListingFilter`
+            models.Index(fields=["price", "bedrooms"], name="listing_price_bedrooms_idx"),
+            models.Index(
+                fields=["created_on", "id"],
+                name="listing_furnished_created_idx",
+                condition=models.Q(is_furnished=True),
+            ),
+            GinIndex(fields=["search_vector"], name="listing_search_vector_idx"),
+            GinIndex(
+                fields=["name"], name="listing_name_trgm_idx", opclasses=["gin_trgm_ops"]
+            ),
+        ]
+
     @property
     def no_of_likes(self) -> int:
-        return self.likes.count()
+        return self.like_count
+
+
+class ListingImageQuerySet(models.QuerySet):
+    def ready(self):
+        return self.filter(status=ListingImage.Status.READY)
+
+    def delete(self):
+        with transaction.atomic():
+            listing_ids = set(self.values_list("listing_id", flat=True))
+            queue_image_deletions(self)
+            deleted = super().delete()
+            Listing.objects.filter(pk__in=listing_ids).touch()
+        return deleted
 
 
 class ListingImage(models.Model):
+    class Status(models.TextChoices):
+        # spooled by the request, waiting for `listings.tasks.upload_listing_images`
+        PENDING = "pending", _("pending")
+        READY = "ready", _("ready")
+        FAILED = "failed", _("failed")
+
     listing = models.ForeignKey(
         Listing, on_delete=models.CASCADE, related_name="images", null=False
     )
-    image_file = CloudinaryField("image")
+    # empty until the image is uploaded
+    image_file = CloudinaryField("image", null=True)
     timestamp = models.DateTimeField(_("timestamp"), auto_now_add=True)
+    status = models.CharField(
+        _("status"), max_length=10, choices=Status.choices, default=Status.READY
+    )
+    # name of the uploaded file in the spool storage, see `listings.uploads`
+    spool_name = models.CharField(_("spool name"), max_length=255, blank=True)
+    # or the remote image Cloudinary fetches itself, e.g for imported listings
+    source_url = models.URLField(_("source url"), max_length=500, blank=True)
+    # urls of the `IMAGE_DERIVATIVES` Cloudinary generated at upload
+    derivatives = models.JSONField(_("derivatives"), default=dict, blank=True)
+
+    objects = ListingImageQuerySet.as_manager()
+
+    def delete(self, *args, **kwargs):
+        # not delete receivers, those would make deleting a listing load and
+        # touch every one of its images instead of one fast DELETE. Images
+        # deleted along with their listing are queued by `queue_listing_images`.
+        with transaction.atomic():
+            if self.image_file:
+                ImageDeletion.objects.create(public_id=self.image_file.public_id)
+            deleted = super().delete(*args, **kwargs)
+            Listing.objects.filter(pk=self.listing_id).touch()
+        return deleted
 
     @property
     def image_url(self):
-        return f"https://res.cloudinary.com/dybhjquqy/{self.image_file}"
+        return f"{IMAGE_BASE_URL}{self.image_file}"
+
+    def derivative_url(self, name):
+        # images uploaded before derivatives existed get them on first request
+        if name in self.derivatives:
+            return self.derivatives[name]
+        transformation = derivative_transformation(name)
+        return cloudinary.CloudinaryImage(
+            self.image_file.public_id, format=transformation.pop("format")
+        ).build_url(secure=True, **transformation)
+
+    @property
+    def thumbnail_url(self):
+        return self.derivative_url("thumb")
+
+    @property
+    def srcset(self):
+        return ", ".join(
+            f"{self.derivative_url(name)} {size['width']}w"
+            for name, size in IMAGE_DERIVATIVES.items()
+        )
+
+
+class ListingTombstone(models.Model):
+    """
+    Left behind by a deleted listing so the change feed can report it
+    """
+
+    listing_id = models.IntegerField(_("listing id"))
+    deleted_on = models.DateTimeField(_("deleted on"), default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["deleted_on", "listing_id"], name="tombstone_deleted_on_idx"
+            )
+        ]
+
+
+class ImageDeletion(models.Model):
+    """
+    Cloudinary image waiting to be deleted
+    """
+
+    public_id = models.CharField(_("public id"), max_length=255)
+    created_on = models.DateTimeField(_("created_on"), auto_now_add=True)
+    attempts = models.PositiveSmallIntegerField(_("attempts"), default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["attempts", "id"], name="image_deletion_due_idx"),
+        ]
+
+
+def queue_image_deletions(images):
+    """
+    Record the uploaded images among `images` in `ImageDeletion`, one INSERT
+    """
+    public_ids = images.filter(image_file__isnull=False).values_list(
+        "image_file", flat=True
+    )
+    ImageDeletion.objects.bulk_create(
+        [ImageDeletion(public_id=image_file.public_id) for image_file in public_ids]
+    )
+
+
+class SavedListingManager(models.Manager):
+    """
+    Saving and unsaving are single statements that are safe to repeat: the
+    INSERT/DELETE and the matching `like_count` update run in one CTE, and only
+    rows that actually changed are counted.
+    """
+
+    def save_listings(self, user, listing_ids):
+        """
+        Save every existing listing in `listing_ids` for `user`, returns the ids
+        that weren't saved before.
+        """
+        return self._run(
+            """
+            WITH changed AS (
+                INSERT INTO {saved} (user_id, listing_id, saved_at)
+                SELECT %(user)s, id, %(now)s FROM {listing} WHERE id = ANY(%(ids)s)
+                ON CONFLICT (user_id, listing_id) DO NOTHING
+                RETURNING listing_id
+            )
+            UPDATE {listing} SET like_count = like_count + 1, updated_on = %(now)s
+            WHERE id IN (SELECT listing_id FROM changed)
+            RETURNING id
+            """,
+            user,
+            listing_ids,
+        )
+
+    def unsave_listings(self, user, listing_ids):
+        """
+        Remove the listings in `listing_ids` from `user`'s saved listings, returns
+        the ids that were saved.
+        """
+        return self._run(
+            """
+            WITH changed AS (
+                DELETE FROM {saved}
+                WHERE user_id = %(user)s AND listing_id = ANY(%(ids)s)
+                RETURNING listing_id
+            )
+            UPDATE {listing} SET like_count = like_count - 1, updated_on = %(now)s
+            WHERE id IN (SELECT listing_id FROM changed)
+            RETURNING id
+            """,
+            user,
+            listing_ids,
+        )
+
+    def _run(self, sql, user, listing_ids):
+        sql = sql.format(
+            saved=self.model._meta.db_table, listing=Listing._meta.db_table
+        )
+        with connection.cursor() as cursor:
+            params = {"user": user.pk, "ids": list(listing_ids), "now": timezone.now()}
+            cursor.execute(sql, params)
+            changed = [row[0] for row in cursor.fetchall()]
+
+        if changed:
+            invalidate_saved_ids(user.pk)
+        return changed
+
+
+class SavedListing(models.Model):
+    """
+    Through table of `Listing.likes`
+    """
+
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name="saved_listings"
+    )
+    listing = models.ForeignKey(
+        Listing, on_delete=models.CASCADE, related_name="saves"
+    )
+    saved_at = models.DateTimeField(_("saved at"), default=timezone.now)
+
+    objects = SavedListingManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "listing"], name="saved_listing_user_listing_uniq"
+            ),
+        ]
+        indexes = [
+            # backs keyset pagination of a user's saved listings
+            models.Index(fields=["user", "-saved_at"], name="saved_listing_user_saved_idx"),
+        ]
 
 
 class Review(models.Model):
@@ -85,17 +410,90 @@ class Review(models.Model):
     message = models.CharField(_("message"), max_length=180, null=False, blank=False)
     timestamp = models.DateTimeField(_("timestamp"), auto_now_add=True)
 
+    def delete(self, *args, **kwargs):
+        # see `ListingImage.delete`
+        deleted = super().delete(*args, **kwargs)
+        Listing.objects.filter(pk=self.listing_id).touch()
+        return deleted
+
+
+# written in the delete's transaction, see `listings.views.ListingChangesView`
+@receiver(pre_delete, sender=Listing)
+def create_tombstone(sender, instance, **kwargs):
+    ListingTombstone.objects.create(listing_id=instance.pk)
+
 
-# delete image(s) from cloudinary on model's deletion
-@receiver(pre_delete, sender=ListingImage)
-def photo_delete(sender, instance, **kwargs):
-    cloudinary.uploader.destroy(instance.image_field.public_id)
+# the listing's saves are removed by the cascade, which sends no m2m_changed
+@receiver(pre_delete, sender=Listing)
+def invalidate_savers_ids(sender, instance, **kwargs):
+    invalidate_saved_ids(*instance.saves.values_list("user_id", flat=True))
 
 
-# update search_vector
+# delete a listing's images from cloudinary, the outbox rows are written in the
+# same transaction and purged by `listings.tasks.purge_deleted_images`
+@receiver(pre_delete, sender=Listing)
+def queue_listing_images(sender, instance, **kwargs):
+    queue_image_deletions(ListingImage.objects.filter(listing=instance))
+
+
+# invalidate cached search results, once the change is visible to other
+# connections. Bumped earlier, a search could cache the old rows under the
+# new generation.
 @receiver(post_save, sender=Listing)
-def update_search_vector(sender, instance, **kwargs):
-    Listing.objects.filter(pk=instance.pk).update(
-        search_vector=SearchVector("name", weight="A")
-                      + SearchVector("description", weight="B")
+@receiver(post_delete, sender=Listing)
+def bump_listing_generation(sender, instance, **kwargs):
+    transaction.on_commit(bump_generation)
+
+
+# keep like_count in step with the likes table, from either side of the relation
+@receiver(m2m_changed, sender=Listing.likes.through)
+def update_like_count(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_remove":
+        # pk_set holds the ids asked for, narrowed to the likes that exist so that
+        # post_remove only counts the rows deleted. Locked until the delete.
+        if not reverse:
+            existing = sender.objects.filter(listing=instance, user__in=pk_set)
+            existing = existing.values_list("user_id", flat=True)
+        else:
+            existing = sender.objects.filter(user=instance, listing__in=pk_set)
+            existing = existing.values_list("listing_id", flat=True)
+        pk_set.intersection_update(existing.select_for_update())
+    elif action in ("post_add", "post_remove"):
+        delta = 1 if action == "post_add" else -1
+        if not reverse:
+            listings = Listing.objects.filter(pk=instance.pk)
+            delta *= len(pk_set)
+            invalidate_saved_ids(*pk_set)
+        else:
+            listings = Listing.objects.filter(pk__in=pk_set)
+            invalidate_saved_ids(instance.pk)
+        listings.update(like_count=F("like_count") + delta, updated_on=timezone.now())
+    elif action == "pre_clear" and reverse:
+        Listing.objects.filter(likes=instance).update(
+            like_count=F("like_count") - 1, updated_on=timezone.now()
+        )
+        invalidate_saved_ids(instance.pk)
+    elif action == "pre_clear" and not reverse:
+        invalidate_saved_ids(*instance.likes.values_list("pk", flat=True))
+    elif action == "post_clear" and not reverse:
+        Listing.objects.filter(pk=instance.pk).update(
+            like_count=0, updated_on=timezone.now()
+        )
+
+
+# a deleted user's likes are removed by the cascade, which sends no m2m_changed
+@receiver(pre_delete, sender=CustomUser)
+def remove_user_likes(sender, instance, **kwargs):
+    Listing.objects.filter(likes=instance).update(
+        like_count=F("like_count") - 1, updated_on=timezone.now()
     )
+    # and their reviews are fast deleted
+    Listing.objects.filter(reviews__user=instance).touch()
+
+
+# a listing's representation includes its images and reviews, deletes are
+# covered by `ListingImage.delete` and `Review.delete`
+@receiver(post_save, sender=ListingImage)
+@receiver(post_save, sender=Review)
+def touch_listing(sender, instance, **kwargs):
+    Listing.objects.filter(pk=instance.listing_id).touch()
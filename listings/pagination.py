@@ -0,0 +1,257 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, timedelta
+
+from django.core.exceptions import ValidationError
+from django.db.models import DateTimeField, Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek pagination over an ordering that ends in a unique column (usually `id`).
+
+    The cursor holds the ordering and its values for the last row served, and the
+    next page is fetched with `WHERE (key, id) < (cursor)` on top of the ordering,
+    so page 100 costs the same as page one and no OFFSET is ever issued.
+
+    Views pick the ordering by setting `keyset_ordering`.
+    """
+
+    ordering = ("-created_on", "-id")
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = getattr(view, "keyset_ordering", self.ordering)
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, self.get_ordering_fields(queryset))
+        if position is not None:
+            queryset = queryset.filter(self.get_seek_filter(position))
+
+        # fetch one extra row to know whether there is a next page
+        results = list(queryset[: self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        results = results[: self.page_size]
+
+        self.next_position = self.get_position(results[-1]) if self.has_next else None
+        return results
+
+    def paginate_rows(self, rows, request, view=None, queryset=None):
+        """
+        Same as `paginate_queryset` for rows that are already sorted by the
+        ordering, each row being a tuple of its ordering values.
+        e.g cached search results
+        `queryset` is the one the rows came from, it gives the cursor values' types.
+        """
+        self.request = request
+        self.ordering = getattr(view, "keyset_ordering", self.ordering)
+        self.page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request, self.get_ordering_fields(queryset))
+        start = 0
+        if position is not None:
+            while start < len(rows) and not self.is_after(rows[start], position):
+                start += 1
+
+        results = rows[start : start + self.page_size]
+        self.has_next = start + self.page_size < len(rows)
+        self.next_position = list(results[-1]) if self.has_next else None
+        return results
+
+    def is_after(self, row, position):
+        for field, value, cursor_value in zip(self.ordering, row, position):
+            if value != cursor_value:
+                if field.startswith("-"):
+                    return value < cursor_value
+                return value > cursor_value
+        return False
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering_fields(self, queryset):
+        """
+        Model fields (or annotations' output fields) of the ordering, used to
+        convert the values of a cursor back
+        """
+        fields = []
+        for name in self.ordering:
+            name = name.lstrip("-")
+            if name in queryset.query.annotations:
+                fields.append(queryset.query.annotations[name].output_field)
+            else:
+                fields.append(queryset.model._meta.get_field(name))
+        return fields
+
+    def get_position(self, instance):
+        return [getattr(instance, field.lstrip("-")) for field in self.ordering]
+
+    def get_seek_filter(self, position):
+        """
+        Expand `(a, b, c) < (x, y, z)` into ORM lookups, respecting each field's
+        direction. The leading column is also bounded on its own so Postgres can use
+        it as an index condition instead of filtering every row before the cursor.
+        """
+        fields = [
+            (field.lstrip("-"), "lt" if field.startswith("-") else "gt")
+            for field in self.ordering
+        ]
+        seek = Q()
+        for index, (field, lookup) in enumerate(fields):
+            condition = Q(**{f"{field}__{lookup}": position[index]})
+            for previous_index, (previous, _) in enumerate(fields[:index]):
+                condition &= Q(**{previous: position[previous_index]})
+            seek |= condition
+
+        leading_field, leading_lookup = fields[0]
+        return Q(**{f"{leading_field}__{leading_lookup}e": position[0]}) & seek
+
+    def encode_cursor(self, position):
+        position = [
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in position
+        ]
+        cursor = {"ordering": list(self.ordering), "position": position}
+        return urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+    def decode_cursor(self, request, fields):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode()))
+            ordering, position = cursor["ordering"], cursor["position"]
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        # a cursor from another ordering (e.g ?ordering changed) can't be seeked from
+        if ordering != list(self.ordering) or not isinstance(position, list):
+            raise NotFound(self.invalid_cursor_message)
+        if len(position) != len(fields):
+            raise NotFound(self.invalid_cursor_message)
+
+        try:
+            return [
+                self.to_python(field, value) for field, value in zip(fields, position)
+            ]
+        except (ValidationError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def to_python(self, field, value):
+        # cursors can be edited by hand, the values are checked like user input
+        if value is None or isinstance(value, (list, dict)):
+            raise ValueError(value)
+        value = field.clean(value, None)
+        if isinstance(field, DateTimeField) and timezone.is_naive(value):
+            raise ValueError(value)
+        return value
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.next_position)
+        )
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class CursorExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = "Cursor is too old, sync again from the start."
+    default_code = "cursor_expired"
+
+
+class ChangeFeedPagination(KeysetPagination):
+    """
+    Keyset pagination over several querysets of changes merged in
+    `(changed_on, changed_id)` order, which each queryset annotates.
+
+    `since` is the position of the last change served. Unlike other pages the
+    next link is always returned, clients keep polling it for new changes.
+    Positions older than `retention` are rejected since the tombstones they
+    would need may be gone.
+    """
+
+    ordering = ("changed_on", "changed_id")
+    page_size = 100
+    max_page_size = 500
+    cursor_query_param = "since"
+    retention = timedelta(days=30)
+
+    def paginate_changes(self, querysets, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request, self.get_ordering_fields(querysets[0]))
+        if position is not None and self.is_expired(position):
+            raise CursorExpired()
+
+        # each queryset is seeked on its own index, the pages are merged here
+        rows = []
+        for queryset in querysets:
+            queryset = queryset.order_by(*self.ordering)
+            if position is not None:
+                queryset = queryset.filter(self.get_seek_filter(position))
+            rows.extend(queryset[: self.page_size + 1])
+        rows.sort(key=self.get_position)
+
+        self.has_next = len(rows) > self.page_size
+        results = rows[: self.page_size]
+        self.next_position = self.get_position(results[-1]) if results else position
+        return results
+
+    def is_expired(self, position):
+        # decode_cursor has made it an aware datetime
+        return position[0] < timezone.now() - self.retention
+
+    def get_next_link(self):
+        url = self.request.build_absolute_uri()
+        if self.next_position is None:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.next_position)
+        )
+
+    def get_paginated_response(self, data):
+        return Response(
+            {"next": self.get_next_link(), "has_more": self.has_next, "changes": data}
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "format": "uri"},
+                "has_more": {"type": "boolean"},
+                "changes": schema,
+            },
+        }
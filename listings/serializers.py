@@ -1,15 +1,30 @@
+from django.db import models, transaction
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
 
 from accounts.serializers import AgentSerializer, UserSerializer
-from .models import Listing, ListingImage, Review
+from .cache import fields_variant, get_fragments
+from .models import Listing, ListingImage, Review, listing_prefetches
+from .tasks import upload_listing_images
+from .uploads import spool_images
 
 
 class ListingImageSerializer(serializers.ModelSerializer):
     image_url = serializers.ReadOnlyField()
+    srcset = serializers.ReadOnlyField()
 
     class Meta:
         model = ListingImage
-        fields = ("image_url",)
+        fields = ("image_url", "srcset")
+
+
+class ListingImageThumbnailSerializer(serializers.ModelSerializer):
+    thumbnail_url = serializers.ReadOnlyField()
+
+    class Meta:
+        model = ListingImage
+        fields = ("thumbnail_url",)
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -30,6 +45,22 @@ class ReviewSerializer(serializers.ModelSerializer):
         return review
 
 
+class CachedListingListSerializer(serializers.ListSerializer):
+    """
+    Assembles lists from the per-listing fragment cache, only the listings that
+    missed are prefetched and serialized. Each fieldset is cached separately and
+    only prefetches the relations it renders.
+    """
+
+    def to_representation(self, data):
+        listings = list(data.all() if isinstance(data, models.Manager) else data)
+        return get_fragments(listings, self.render, fields_variant(self.child.fields))
+
+    def render(self, listings):
+        prefetch_related_objects(listings, *listing_prefetches(self.child.fields))
+        return [self.child.to_representation(listing) for listing in listings]
+
+
 class ListingSerializer(serializers.ModelSerializer):
     no_of_likes = serializers.ReadOnlyField()
     listing_images = ListingImageSerializer(many=True, read_only=True, source="images")
@@ -56,6 +87,19 @@ class ListingSerializer(serializers.ModelSerializer):
             "created_on",
         )
         extra_kwargs = {"created_on": {"read_only": True}}
+        list_serializer_class = CachedListingListSerializer
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not isinstance(self.parent, serializers.ListSerializer):
+            return fields
+
+        # lists only show a thumbnail of each image, and only the fields asked for
+        fields["listing_images"] = ListingImageThumbnailSerializer(
+            many=True, read_only=True, source="images"
+        )
+        selected = self.context.get("listing_fields", LIST_FIELDS)
+        return {name: field for name, field in fields.items() if name in selected}
 
     def create(self, validated_data):
         images_data = self.context.get("request").FILES
@@ -64,7 +108,54 @@ class ListingSerializer(serializers.ModelSerializer):
 
         listing = Listing.objects.create(**validated_data)
 
-        for image_data in images_data.getlist("file"):
-            ListingImage.objects.create(listing=listing, image_file=image_data)
+        # images are uploaded by a huey task, the listing shows them once they're ready
+        if spool_images(listing, images_data.getlist("file")):
+            transaction.on_commit(lambda: upload_listing_images(listing.pk))
 
         return listing
+
+
+# compact list representation, `?fields=` and `?expand=` change it
+LIST_FIELDS = (
+    "id",
+    "name",
+    "location",
+    "price",
+    "is_new",
+    "is_furnished",
+    "bedrooms",
+    "bathrooms",
+    "lounges",
+    "no_of_likes",
+    "listing_images",
+    "created_on",
+)
+
+
+def select_listing_fields(query_params):
+    """
+    Fields for a list of listings: exactly `?fields=` when given, else
+    `LIST_FIELDS` plus `?expand=`. Both are comma separated.
+    """
+
+    def parse(param):
+        names = [name.strip() for name in query_params.get(param, "").split(",")]
+        names = [name for name in names if name]
+        unknown = [name for name in names if name not in ListingSerializer.Meta.fields]
+        if unknown:
+            raise ValidationError({param: f"Unknown fields: {', '.join(unknown)}"})
+        return names
+
+    fields = parse("fields") or LIST_FIELDS
+    selected = set(fields).union(parse("expand"))
+    # always in the serializer's order, so equal fieldsets share cached fragments
+    return tuple(name for name in ListingSerializer.Meta.fields if name in selected)
+
+
+class BulkSaveSerializer(serializers.Serializer):
+    save = serializers.ListField(
+        child=serializers.IntegerField(), required=False, default=list, max_length=100
+    )
+    unsave = serializers.ListField(
+        child=serializers.IntegerField(), required=False, default=list, max_length=100
+    )
@@ -0,0 +1,35 @@
+from huey import crontab
+from django.utils import timezone
+from huey.contrib import djhuey as huey
+
+from . import uploads
+from .models import ListingTombstone
+from .pagination import ChangeFeedPagination
+
+
+class ImageUploadError(Exception):
+    pass
+
+
+@huey.task(retries=3, retry_delay=60, context=True)
+def upload_listing_images(listing_id, task=None):
+    failed = uploads.upload_pending_images(listing_id)
+    if not failed:
+        return
+    if task is not None and task.retries:
+        # huey runs the task again, only the images still pending are uploaded
+        raise ImageUploadError(f"{len(failed)} images of listing {listing_id} failed")
+    uploads.discard_images(failed)
+
+
+@huey.db_periodic_task(crontab(minute="*/10"))
+def purge_deleted_images():
+    uploads.purge_deleted_images()
+
+
+@huey.db_periodic_task(crontab(minute="0", hour="3"))
+def purge_listing_tombstones():
+    # change feed cursors this old are rejected anyway
+    ListingTombstone.objects.filter(
+        deleted_on__lt=timezone.now() - ChangeFeedPagination.retention
+    ).delete()
@@ -1,3 +1,1266 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
+from base64 import urlsafe_b64encode
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import cloudinary.exceptions
+from cloudinary import CloudinaryResource
+from django.contrib.postgres.search import SearchVector
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import (
+    Client,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Agent, CustomUser
+from .cache import get_generation, get_search_stats, single_flight
+from .models import (
+    ImageDeletion,
+    Listing,
+    ListingImage,
+    Review,
+    SavedListing,
+)
+from .pagination import ChangeFeedPagination
+from .serializers import ListingSerializer
+from .tasks import ImageUploadError, upload_listing_images
+from .uploads import (
+    MAX_DELETE_ATTEMPTS,
+    SpooledUploadedFile,
+    purge_deleted_images,
+    upload_pending_images,
+)
+from .views import ListingChangesView
+
+
+def create_agent(email="agent@test.com", display_name="Test Realty"):
+    user = CustomUser.objects.create_user(
+        email=email,
+        password="password",
+        first_name="Test",
+        last_name="Agent",
+        is_agent=True,
+        is_confirmed=True,
+    )
+    return Agent.objects.create(
+        user=user, phone_number="08000000000", agent_display_name=display_name
+    )
+
+
+def create_customer(email="customer@test.com"):
+    return CustomUser.objects.create_user(
+        email=email,
+        password="password",
+        first_name="Test",
+        last_name="Customer",
+        is_customer=True,
+        is_confirmed=True,
+    )
+
+
+def authenticate(client, user):
+    client.defaults["HTTP_AUTHORIZATION"] = f"Token {user.auth_token.key}"
+
+
+def fake_upload(file):
+    """
+    Stand-in for `listings.uploads.cloudinary_upload`
+    """
+    if isinstance(file, str):
+        # a remote url, fetched by Cloudinary itself
+        name = os.path.splitext(os.path.basename(file))[0]
+    else:
+        name = os.path.splitext(os.path.basename(file.name))[0]
+        if file.read().startswith(b"fail"):
+            raise OSError("upload failed")
+    eager = [
+        {"secure_url": f"https://cdn.test/{size}/{name}.webp"}
+        for size in ("thumb", "card", "full")
+    ]
+    return CloudinaryResource(
+        public_id=name,
+        version="1",
+        format="jpg",
+        type="upload",
+        resource_type="image",
+        metadata={"eager": eager},
+    )
+
+
+def create_listing(agent, reviewers=(), **kwargs):
+    fields = {
+        "name": "Two bedroom flat",
+        "description": "A lovely two bedroom flat close to the lagoon",
+        "location": "Lekki, Lagos",
+        "price": 500000,
+        "bedrooms": 2,
+        "bathrooms": 2,
+    }
+    fields.update(kwargs)
+    listing = Listing.objects.create(agent=agent, **fields)
+    ListingImage.objects.create(listing=listing, image_file="image/upload/v1/a.jpg")
+    ListingImage.objects.create(listing=listing, image_file="image/upload/v1/b.jpg")
+    for reviewer in reviewers:
+        Review.objects.create(listing=listing, user=reviewer, message="Nice place")
+        listing.likes.add(reviewer)
+    return listing
+
+
+class ListingQueryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = create_agent()
+        self.reviewers = [create_customer(f"customer{i}@test.com") for i in range(3)]
+
+    def get_query_count(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_all_listings_query_count_is_independent_of_page_size(self):
+        for _ in range(5):
+            create_listing(self.agent, self.reviewers)
+
+        url = reverse("all-listings")
+        single = self.get_query_count(f"{url}?page_size=1")
+        cache.clear()
+        many = self.get_query_count(f"{url}?page_size=5")
+
+        self.assertEqual(single, many)
+
+    def test_cached_fragments_skip_related_queries(self):
+        for _ in range(5):
+            create_listing(self.agent, self.reviewers)
+
+        url = reverse("all-listings")
+        cold = self.client.get(url)
+        # the page itself, which also gives the conditional GET validators
+        with self.assertNumQueries(1):
+            warm = self.client.get(url)
+        self.assertEqual(cold.data, warm.data)
+
+    def test_changed_listing_is_rerendered(self):
+        listing = create_listing(self.agent)
+        url = f"{reverse('all-listings')}?expand=reviews"
+        self.client.get(url)
+
+        Review.objects.create(listing=listing, user=self.reviewers[0], message="Meh")
+        response = self.client.get(url)
+        self.assertEqual(len(response.data["results"][0]["reviews"]), 1)
+
+    def test_no_of_likes_reads_the_like_count_column(self):
+        create_listing(self.agent, self.reviewers)
+        listing = Listing.objects.with_related().get()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(listing.no_of_likes, 3)
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = create_agent()
+        self.reviewers = [create_customer(f"customer{i}@test.com") for i in range(2)]
+        for _ in range(3):
+            create_listing(self.agent, self.reviewers)
+
+    def get(self, query=""):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f"{reverse('all-listings')}{query}")
+        return response, context.captured_queries
+
+    def test_compact_default(self):
+        response, queries = self.get()
+
+        listing = response.data["results"][0]
+        self.assertNotIn("reviews", listing)
+        self.assertNotIn("agent", listing)
+        self.assertNotIn("description", listing)
+        self.assertIn("listing_images", listing)
+        sql = " ".join(query["sql"] for query in queries)
+        self.assertNotIn("listings_review", sql)
+        self.assertNotIn('"description"', sql)
+
+    def test_fields(self):
+        response, queries = self.get("?fields=id,name,price")
+
+        self.assertEqual(set(response.data["results"][0]), {"id", "name", "price"})
+        sql = " ".join(query["sql"] for query in queries)
+        self.assertNotIn("listings_listingimage", sql)
+
+    def test_expand(self):
+        response, _ = self.get("?expand=reviews,agent,description")
+
+        listing = response.data["results"][0]
+        self.assertEqual(len(listing["reviews"]), 2)
+        self.assertEqual(listing["agent"]["agent_display_name"], "Test Realty")
+        self.assertIn("description", listing)
+        self.assertIn("price", listing)
+
+    def test_fieldsets_are_cached_separately(self):
+        compact, _ = self.get()
+        expanded, _ = self.get("?expand=reviews")
+
+        self.assertNotIn("reviews", compact.data["results"][0])
+        self.assertIn("reviews", expanded.data["results"][0])
+
+    def test_unknown_fields(self):
+        response, _ = self.get("?fields=id,password")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("fields", response.data)
+
+
+class ListingBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = create_agent()
+        self.listings = [create_listing(self.agent) for _ in range(3)]
+
+    def get(self, ids, query=""):
+        return self.client.get(f"{reverse('listing-batch')}?ids={ids}{query}")
+
+    def test_requested_order_and_missing_ids(self):
+        first, second, third = [listing.pk for listing in self.listings]
+        response = self.get(f"{third},999,{first},{third}")
+
+        self.assertEqual(response.status_code, 200)
+        ids = [listing["id"] for listing in response.data["results"]]
+        self.assertEqual(ids, [third, first])
+        self.assertEqual(response.data["missing"], [999])
+
+    def test_cached_listings_take_one_query(self):
+        ids = ",".join(str(listing.pk) for listing in self.listings)
+        cold = self.get(ids, "&expand=reviews")
+
+        with self.assertNumQueries(1):
+            warm = self.get(ids, "&expand=reviews")
+        self.assertEqual(cold.data, warm.data)
+
+    def test_invalid_ids(self):
+        self.assertEqual(self.get("").status_code, 400)
+        self.assertEqual(self.get("1,abc").status_code, 400)
+        ids = ",".join(str(pk) for pk in range(1, 52))
+        self.assertEqual(self.get(ids).status_code, 400)
+
+
+@mock.patch.object(ListingChangesView, "settle_delay", timedelta(0))
+class ListingChangesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = create_agent()
+        self.listings = [create_listing(self.agent) for _ in range(3)]
+
+    def sync(self, url=None):
+        response = self.client.get(url or reverse("listing-changes"))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_initial_sync_then_only_changes(self):
+        feed = self.sync()
+        self.assertEqual(
+            [change["id"] for change in feed["changes"]],
+            [listing.pk for listing in self.listings],
+        )
+        self.assertFalse(feed["has_more"])
+
+        self.assertEqual(self.sync(feed["next"])["changes"], [])
+
+        first, second, _ = self.listings
+        deleted_pk = first.pk
+        second.price = 1000
+        second.save()
+        first.delete()
+        changes = self.sync(feed["next"])["changes"]
+        self.assertEqual(
+            [(change["id"], change["deleted"]) for change in changes],
+            [(second.pk, False), (deleted_pk, True)],
+        )
+        self.assertEqual(changes[0]["listing"]["price"], 1000)
+
+    def test_pages(self):
+        url = f"{reverse('listing-changes')}?page_size=2"
+        feed = self.sync(url)
+        self.assertTrue(feed["has_more"])
+        self.assertEqual(len(self.sync(feed["next"])["changes"]), 1)
+
+    def test_expired_cursor(self):
+        old = timezone.now() - ChangeFeedPagination.retention - timedelta(days=1)
+        cursor = ChangeFeedPagination().encode_cursor([old, 1])
+        response = self.client.get(f"{reverse('listing-changes')}?since={cursor}")
+
+        self.assertEqual(response.status_code, 410)
+
+    def test_invalid_cursor(self):
+        ordering = ["changed_on", "changed_id"]
+        for position in (["2026-01-01T00:00:00", 1], ["2026-01-01T00:00:00Z", "x"]):
+            cursor = urlsafe_b64encode(
+                json.dumps({"ordering": ordering, "position": position}).encode()
+            ).decode()
+            response = self.client.get(f"{reverse('listing-changes')}?since={cursor}")
+            self.assertEqual(response.status_code, 404, position)
+
+    def test_recent_changes_wait_to_settle(self):
+        with mock.patch.object(ListingChangesView, "settle_delay", timedelta(hours=1)):
+            self.assertEqual(self.sync()["changes"], [])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        agent = create_agent()
+        create_listing(agent, location="Lekki, Lagos")
+        create_listing(agent, location="Ikeja, Lagos", name="Three bedroom duplex")
+        ListingImage.objects.create(
+            listing=Listing.objects.first(), status=ListingImage.Status.PENDING
+        )
+
+        self.admin = create_customer("admin@test.com")
+        self.admin.is_staff = True
+        self.admin.save()
+        authenticate(self.client, self.admin)
+
+    def export(self, query=""):
+        response = self.client.get(f"{reverse('export-listings')}{query}")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export().splitlines()]
+
+        ids = [row["id"] for row in rows]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(rows[0]["agent_display_name"], "Test Realty")
+        # pending images aren't exported
+        self.assertEqual(
+            rows[0]["image_urls"],
+            [
+                "https://res.cloudinary.com/dybhjquqy/a",
+                "https://res.cloudinary.com/dybhjquqy/b",
+            ],
+        )
+
+    def test_csv_with_filters(self):
+        lines = self.export("?output=csv&location=Ikeja").splitlines()
+        rows = list(csv.DictReader(lines))
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["name"], "Three bedroom duplex")
+        self.assertEqual(len(rows[0]["image_urls"].split(" ")), 2)
+
+    def test_invalid_output(self):
+        response = self.client.get(f"{reverse('export-listings')}?output=xml")
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_admin_only(self):
+        authenticate(self.client, create_customer())
+
+        self.assertEqual(self.client.get(reverse("export-listings")).status_code, 403)
+
+
+@mock.patch("listings.management.commands.import_listings.upload_listing_images")
+class ImportListingsTests(TestCase):
+    def setUp(self):
+        create_agent()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as file:
+            file.write(content)
+        return path
+
+    def run_import(self, path, **options):
+        stderr = StringIO()
+        with mock.patch("django.db.transaction.on_commit", lambda func: func()):
+            call_command(
+                "import_listings", path, stdout=StringIO(), stderr=stderr, **options
+            )
+        return stderr.getvalue()
+
+    def test_csv(self, upload_listing_images):
+        path = self.write(
+            "listings.csv",
+            "name,description,location,price,bedrooms,is_furnished,"
+            "agent_display_name,image_urls\n"
+            "Duplex,Five bedroom duplex,Lekki,900000,5,true,Test Realty,"
+            "https://img.test/1.jpg https://img.test/2.jpg\n"
+            "Flat,Small flat,Yaba,abc,1,false,Test Realty,\n"
+            "Studio,Cosy studio,Ikeja,100000,1,false,Unknown Realty,\n"
+            "Bungalow,Quiet bungalow,Ikeja,300000,3,0,Test Realty,\n",
+        )
+        errors = self.run_import(path, chunk_size=2)
+
+        self.assertIn("Row 2 skipped: price must be a whole number", errors)
+        self.assertIn("Row 3 skipped: no agent named 'Unknown Realty'", errors)
+        duplex = Listing.objects.get(name="Duplex")
+        self.assertEqual((duplex.price, duplex.bedrooms), (900000, 5))
+        self.assertTrue(duplex.is_furnished)
+        self.assertFalse(Listing.objects.get(name="Bungalow").is_furnished)
+        self.assertEqual(Listing.objects.search("duplex").get(), duplex)
+
+        images = ListingImage.objects.filter(listing=duplex)
+        self.assertEqual(
+            sorted(images.values_list("source_url", flat=True)),
+            ["https://img.test/1.jpg", "https://img.test/2.jpg"],
+        )
+        self.assertEqual(images.filter(status=ListingImage.Status.PENDING).count(), 2)
+        upload_listing_images.assert_called_once_with(duplex.pk)
+
+    def test_ndjson(self, upload_listing_images):
+        row = {
+            "id": 99,
+            "name": "Duplex",
+            "description": "Five bedroom duplex",
+            "location": "Lekki",
+            "price": 900000,
+            "is_new": True,
+            "agent_display_name": "Test Realty",
+            "image_urls": [],
+        }
+        self.run_import(self.write("listings.ndjson", json.dumps(row) + "\n"))
+
+        listing = Listing.objects.get()
+        self.assertNotEqual(listing.pk, 99)
+        self.assertTrue(listing.is_new)
+        upload_listing_images.assert_not_called()
+
+    def test_values_the_table_cant_hold_are_skipped(self, upload_listing_images):
+        row = {
+            "name": "Duplex",
+            "description": "Five bedroom duplex",
+            "location": "Lekki",
+            "price": 900000,
+            "agent_display_name": "Test Realty",
+        }
+        rows = [
+            {**row, "name": "x" * 200},
+            {**row, "price": 2 ** 40},
+            {**row, "image_urls": ["not a url"]},
+            row,
+        ]
+        errors = self.run_import(
+            self.write("listings.ndjson", "\n".join(map(json.dumps, rows)))
+        )
+
+        self.assertIn("Row 1 skipped: name: Ensure this value has at most 150", errors)
+        self.assertIn("Row 2 skipped: price: Ensure this value is less than", errors)
+        self.assertIn("Row 3 skipped: Enter a valid URL.", errors)
+        self.assertEqual(Listing.objects.get().name, "Duplex")
+
+    def test_malformed_ndjson_lines_are_skipped(self, upload_listing_images):
+        row = json.dumps(
+            {
+                "name": "Duplex",
+                "description": "Five bedroom duplex",
+                "location": "Lekki",
+                "price": 900000,
+                "agent_display_name": "Test Realty",
+            }
+        )
+        content = "\n".join(['{"name": "Duplex",', "[1, 2]", row]) + "\n"
+        errors = self.run_import(self.write("listings.ndjson", content))
+
+        self.assertIn("Row 1 skipped: invalid JSON", errors)
+        self.assertIn("Row 2 skipped: not a JSON object", errors)
+        self.assertEqual(Listing.objects.get().name, "Duplex")
+
+    def test_missing_file(self, upload_listing_images):
+        with self.assertRaisesMessage(CommandError, "Can't read"):
+            self.run_import(os.path.join(self.directory, "missing.csv"))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.agent = create_agent()
+        self.listings = [create_listing(self.agent) for _ in range(5)]
+
+    def test_pages_follow_created_on_then_id(self):
+        url = f"{reverse('all-listings')}?page_size=2"
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(listing["id"] for listing in response.data["results"])
+            url = response.data["next"]
+
+        expected = sorted(self.listings, key=lambda l: (l.created_on, l.id), reverse=True)
+        self.assertEqual(seen, [listing.id for listing in expected])
+
+    def test_ties_on_created_on_are_broken_by_id(self):
+        Listing.objects.update(created_on=self.listings[0].created_on)
+
+        first = self.client.get(f"{reverse('all-listings')}?page_size=3")
+        second = self.client.get(first.data["next"])
+
+        ids = [l["id"] for l in first.data["results"] + second.data["results"]]
+        self.assertEqual(ids, sorted((l.id for l in self.listings), reverse=True))
+        self.assertIsNone(second.data["next"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(f"{reverse('all-listings')}?cursor=garbage")
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor(self):
+        ordering = ["-created_on", "-id"]
+        positions = [
+            ["abc", "x"],
+            ["2026-01-01T00:00:00", "x"],
+            # naive datetime
+            ["2026-01-01T00:00:00", 1],
+            ["2026-01-01T00:00:00+00:00", None],
+            ["2026-01-01T00:00:00+00:00", 2 ** 40],
+            ["2026-01-01T00:00:00+00:00"],
+        ]
+        for position in positions:
+            cursor = urlsafe_b64encode(
+                json.dumps({"ordering": ordering, "position": position}).encode()
+            ).decode()
+            response = self.client.get(f"{reverse('all-listings')}?cursor={cursor}")
+            self.assertEqual(response.status_code, 404, position)
+
+    def test_cursor_from_another_ordering(self):
+        first = self.client.get(f"{reverse('all-listings')}?page_size=2")
+        cursor = first.data["next"].split("cursor=")[1]
+
+        response = self.client.get(
+            f"{reverse('all-listings')}?ordering=price&cursor={cursor}"
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_search_cursor(self):
+        cursor = urlsafe_b64encode(
+            json.dumps({"ordering": ["-rank", "-id"], "position": ["x", 1]}).encode()
+        ).decode()
+        response = self.client.get(f"{reverse('search-listing')}?q=flat&cursor={cursor}")
+        self.assertEqual(response.status_code, 404)
+
+
+class ListingFilterTests(TestCase):
+    def setUp(self):
+        agent = create_agent()
+        self.cheap = create_listing(agent, price=90000, bedrooms=1, location="Yaba, Lagos")
+        self.mid = create_listing(
+            agent, price=600000, bedrooms=3, is_furnished=True, location="Lekki, Lagos"
+        )
+        self.mansion = create_listing(
+            agent, price=5000000, bedrooms=6, bathrooms=7, location="Ikoyi, Lagos"
+        )
+
+    def get_ids(self, query):
+        response = self.client.get(f"{reverse('all-listings')}?{query}")
+        self.assertEqual(response.status_code, 200)
+        return {listing["id"] for listing in response.data["results"]}
+
+    def test_capped_values(self):
+        self.assertEqual(self.get_ids("price=100000"), {self.cheap.id})
+        self.assertEqual(self.get_ids("price=1000001"), {self.mansion.id})
+        self.assertEqual(self.get_ids("bedrooms=5"), {self.mansion.id})
+        four_bedrooms = create_listing(self.mansion.agent, price=2000000, bedrooms=4)
+        # "For 4+ bedrooms, pass 5"
+        self.assertEqual(self.get_ids("bedrooms=5"), {four_bedrooms.id, self.mansion.id})
+        self.assertEqual(self.get_ids("bedrooms=3&price=Any"), {self.cheap.id, self.mid.id})
+
+    def test_ranges_sets_and_prefix(self):
+        self.assertEqual(
+            self.get_ids("price_min=100000&price_max=1000000"), {self.mid.id}
+        )
+        self.assertEqual(self.get_ids("bedrooms_in=1,6"), {self.cheap.id, self.mansion.id})
+        self.assertEqual(len(self.get_ids("bedrooms_in=,")), 3)
+        self.assertEqual(self.get_ids("location=lekki"), {self.mid.id})
+        self.assertEqual(self.get_ids("is_furnished=1"), {self.mid.id})
+        self.assertEqual(
+            self.get_ids("is_furnished=0"), {self.cheap.id, self.mansion.id}
+        )
+
+    def test_ordering(self):
+        response = self.client.get(f"{reverse('all-listings')}?ordering=price&page_size=2")
+        next_page = self.client.get(response.data["next"])
+
+        ids = [l["id"] for l in response.data["results"] + next_page.data["results"]]
+        self.assertEqual(ids, [self.cheap.id, self.mid.id, self.mansion.id])
+
+    def test_invalid_values(self):
+        for query in ("price=cheap", "is_furnished=maybe", "ordering=name"):
+            response = self.client.get(f"{reverse('all-listings')}?{query}")
+            self.assertEqual(response.status_code, 400)
+
+
+class SearchVectorTests(TestCase):
+    def setUp(self):
+        self.listing = create_listing(create_agent(), name="Penthouse suite")
+
+    def test_trigger_maintains_search_vector(self):
+        self.assertTrue(Listing.objects.filter(search_vector="penthouse").exists())
+        self.assertTrue(Listing.objects.filter(search_vector="lekki").exists())
+
+        self.listing.name = "Bungalow"
+        self.listing.save()
+        self.assertFalse(Listing.objects.filter(search_vector="penthouse").exists())
+        self.assertTrue(Listing.objects.filter(search_vector="bungalow").exists())
+
+    def test_backfill_command(self):
+        Listing.objects.update(search_vector=None)
+
+        call_command("backfill_search_vector", chunk_size=1, stdout=StringIO())
+        self.assertTrue(Listing.objects.filter(search_vector="penthouse").exists())
+
+    def test_backfill_recomputes_stale_vectors(self):
+        # a vector from before the location was included
+        Listing.objects.update(search_vector=SearchVector("name", config="english"))
+        self.assertFalse(Listing.objects.filter(search_vector="lekki").exists())
+
+        call_command("backfill_search_vector", stdout=StringIO())
+        self.assertTrue(Listing.objects.filter(search_vector="lekki").exists())
+
+    def test_backfill_missing_only(self):
+        Listing.objects.update(search_vector=SearchVector("name", config="english"))
+
+        call_command("backfill_search_vector", missing_only=True, stdout=StringIO())
+        self.assertFalse(Listing.objects.filter(search_vector="lekki").exists())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        agent = create_agent()
+        self.flat = create_listing(agent, name="Two bedroom flat")
+        self.duplex = create_listing(
+            agent,
+            name="Five bedroom duplex",
+            description="Detached duplex with a boys quarters",
+            location="Ikeja, Lagos",
+        )
+
+    def search(self, query):
+        response = self.client.get(f"{reverse('search-listing')}?q={query}")
+        self.assertEqual(response.status_code, 200)
+        return [listing["id"] for listing in response.data["results"]]
+
+    def test_ranks_stored_vector_matches(self):
+        self.assertEqual(self.search("duplex"), [self.duplex.id])
+        # the flat also mentions bedrooms in its description
+        self.assertEqual(self.search("bedroom"), [self.flat.id, self.duplex.id])
+
+    def test_candidate_cut_keeps_the_best_matches(self):
+        best = create_listing(
+            self.duplex.agent,
+            name="Duplex",
+            description="Duplex, a terraced duplex",
+            location="Duplex estate, Lagos",
+        )
+        with mock.patch("listings.models.SEARCH_CANDIDATE_LIMIT", 1):
+            self.assertEqual(self.search("duplex"), [best.id])
+
+    def test_fuzzy_name_fallback(self):
+        self.assertEqual(self.search("five bedrom duplex"), [self.duplex.id])
+
+    def test_empty_query(self):
+        self.assertEqual(self.search(""), [])
+
+
+class SearchCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = create_agent()
+        self.listings = [create_listing(self.agent) for _ in range(3)]
+
+    def search(self, query, **params):
+        return self.client.get(reverse("search-listing"), {"q": query, **params})
+
+    def test_repeated_queries_are_served_from_cache(self):
+        self.search("two bedroom flat")
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.search("  Two   Bedroom FLAT ")
+        self.assertNotIn("ts_rank_cd", " ".join(q["sql"] for q in context))
+        self.assertEqual(len(response.data["results"]), 3)
+        self.assertEqual(get_search_stats()["hits"], 1)
+        self.assertEqual(get_search_stats()["misses"], 1)
+
+    def test_saving_a_listing_invalidates_results(self):
+        self.search("flat")
+        callbacks = []
+        with mock.patch("django.db.transaction.on_commit", callbacks.append):
+            create_listing(self.agent, name="Another flat")
+
+        # not until the listing is committed
+        generation = get_generation()
+        self.assertEqual(len(self.search("flat").data["results"]), 3)
+        self.assertEqual(get_generation(), generation)
+        for callback in callbacks:
+            callback()
+
+        response = self.search("flat")
+        self.assertEqual(len(response.data["results"]), 4)
+        self.assertEqual(get_search_stats()["misses"], 2)
+
+    def test_cached_results_are_paginated(self):
+        first = self.search("flat", page_size=2)
+        second = self.client.get(first.data["next"])
+
+        ids = [l["id"] for l in first.data["results"] + second.data["results"]]
+        self.assertEqual(ids, sorted((l.id for l in self.listings), reverse=True))
+        self.assertIsNone(second.data["next"])
+
+    def test_stats_are_admin_only(self):
+        self.assertEqual(self.client.get(reverse("search-cache-stats")).status_code, 401)
+
+
+class LikeCountTests(TestCase):
+    def setUp(self):
+        self.listing = create_listing(create_agent())
+        self.user = create_customer()
+        authenticate(self.client, self.user)
+
+    def assertLikeCount(self, count):
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.like_count, count)
+
+    def test_save_and_unsave_are_idempotent(self):
+        url = reverse("add-listing-to-saved", args=[self.listing.pk])
+        for _ in range(2):
+            self.assertEqual(self.client.post(url).status_code, 200)
+            self.assertLikeCount(1)
+
+        url = reverse("remove-listing-from-saved", args=[self.listing.pk])
+        for _ in range(2):
+            self.assertEqual(self.client.post(url).status_code, 200)
+            self.assertLikeCount(0)
+
+    def test_save_missing_listing(self):
+        url = reverse("add-listing-to-saved", args=[self.listing.pk + 100])
+        self.assertEqual(self.client.post(url).status_code, 404)
+
+    def test_saved_listings_are_ordered_by_save_time(self):
+        newer = create_listing(self.listing.agent)
+        SavedListing.objects.save_listings(self.user, [newer.pk])
+        SavedListing.objects.save_listings(self.user, [self.listing.pk])
+
+        response = self.client.get(reverse("saved-listings"))
+        ids = [listing["id"] for listing in response.data["results"]]
+        self.assertEqual(ids, [self.listing.pk, newer.pk])
+
+    def test_either_side_of_the_relation(self):
+        other = create_customer("other@test.com")
+        self.listing.likes.add(self.user, other)
+        self.assertLikeCount(2)
+
+        other.listing_likes.clear()
+        self.assertLikeCount(1)
+
+        self.listing.likes.clear()
+        self.assertLikeCount(0)
+
+    def test_remove_only_counts_existing_likes(self):
+        other = create_customer("other@test.com")
+        self.listing.likes.add(self.user)
+
+        self.listing.likes.remove(other)
+        self.assertLikeCount(1)
+
+        other.listing_likes.remove(self.listing)
+        self.assertLikeCount(1)
+
+        self.user.listing_likes.remove(self.listing)
+        self.assertLikeCount(0)
+
+    def test_deleting_a_user_removes_their_likes(self):
+        other = create_customer("other@test.com")
+        self.listing.likes.add(self.user, other)
+
+        other.delete()
+        self.assertLikeCount(1)
+        self.assertFalse(Listing.objects.with_like_count_drift().exists())
+
+    def test_reconcile_command(self):
+        self.listing.likes.add(self.user)
+        Listing.objects.update(like_count=42)
+
+        call_command("reconcile_like_counts", stdout=StringIO())
+        self.assertLikeCount(1)
+
+
+class BulkSaveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        agent = create_agent()
+        self.listings = [create_listing(agent) for _ in range(3)]
+        self.user = create_customer()
+        authenticate(self.client, self.user)
+
+    def get_saved_ids(self):
+        response = self.client.get(reverse("saved-listing-ids"))
+        self.assertEqual(response.status_code, 200)
+        return response.data["ids"]
+
+    def test_bulk_save_and_unsave(self):
+        first, second, third = (listing.pk for listing in self.listings)
+        SavedListing.objects.save_listings(self.user, [third])
+
+        response = self.client.post(
+            reverse("bulk-save-listings"),
+            {"save": [first, second, 9999], "unsave": [third]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.data["saved"]), [first, second])
+        self.assertEqual(response.data["unsaved"], [third])
+        self.assertEqual(
+            [l.like_count for l in Listing.objects.order_by("pk")], [1, 1, 0]
+        )
+
+    def test_saved_ids_are_cached_and_invalidated(self):
+        listing = self.listings[0]
+        self.assertEqual(self.get_saved_ids(), [])
+
+        # the token lookup is cached as well
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_saved_ids(), [])
+
+        SavedListing.objects.save_listings(self.user, [listing.pk])
+        self.assertEqual(self.get_saved_ids(), [listing.pk])
+
+        listing.likes.remove(self.user)
+        self.assertEqual(self.get_saved_ids(), [])
+
+    def test_deleted_listings_leave_the_saved_ids(self):
+        listing = self.listings[0]
+        SavedListing.objects.save_listings(self.user, [listing.pk])
+        self.assertEqual(self.get_saved_ids(), [listing.pk])
+
+        listing.delete()
+        self.assertEqual(self.get_saved_ids(), [])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.listing = create_listing(create_agent())
+        self.url = reverse("single-listing", args=[self.listing.pk])
+
+    def test_unchanged_listing_is_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_related_changes_bump_the_version(self):
+        etag = self.client.get(self.url)["ETag"]
+        for change in (
+            lambda: Review.objects.create(
+                listing=self.listing, user=create_customer(), message="Lovely"
+            ),
+            lambda: ListingImage.objects.create(
+                listing=self.listing, image_file="image/upload/v1/c.jpg"
+            ),
+            lambda: SavedListing.objects.save_listings(
+                create_customer("other@test.com"), [self.listing.pk]
+            ),
+        ):
+            change()
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            etag = response["ETag"]
+
+    def test_list_view(self):
+        url = f"{reverse('all-listings')}?bedrooms=2"
+        response = self.client.get(url)
+        self.assertNotIn("Last-Modified", response)
+
+        # only the page's keyset window is read
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+        create_listing(self.listing.agent)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_view_ignores_other_pages(self):
+        url = f"{reverse('all-listings')}?page_size=1"
+        older = self.listing
+        create_listing(self.listing.agent)
+        etag = self.client.get(url)["ETag"]
+
+        SavedListing.objects.save_listings(create_customer(), [older.pk])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        older.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_deleting_related_objects_bumps_the_version(self):
+        review = Review.objects.create(
+            listing=self.listing, user=create_customer(), message="Lovely"
+        )
+        for related in (review, self.listing.images.first()):
+            etag = self.client.get(self.url)["ETag"]
+            related.delete()
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+
+    def test_deleting_images_in_bulk_bumps_the_version(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.listing.images.all().delete()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["listing_images"], [])
+
+    def test_deleting_a_listing_doesnt_touch_it_per_review(self):
+        def delete_query_count(review_count):
+            listing = create_listing(self.listing.agent)
+            for index in range(review_count):
+                Review.objects.create(
+                    listing=listing, user=reviewer, message=f"Review {index}"
+                )
+            with CaptureQueriesContext(connection) as context:
+                listing.delete()
+            return len(context.captured_queries)
+
+        reviewer = create_customer()
+        self.assertEqual(delete_query_count(1), delete_query_count(20))
+
+    def test_missing_listing(self):
+        url = reverse("single-listing", args=[self.listing.pk + 1])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.rebuilds = 0
+        self.lock = threading.Lock()
+
+    def slow_compute(self, value):
+        def compute():
+            with self.lock:
+                self.rebuilds += 1
+            time.sleep(0.2)
+            return value
+
+        return compute
+
+    def run_in_parallel(self, version, value, workers=10):
+        start = threading.Barrier(workers)
+
+        def worker():
+            start.wait()
+            return single_flight("test:key", self.slow_compute(value), 60, version)
+
+        with ThreadPoolExecutor(workers) as executor:
+            futures = [executor.submit(worker) for _ in range(workers)]
+            return [future.result() for future in futures]
+
+    def test_cold_miss_is_rebuilt_once(self):
+        results = self.run_in_parallel(1, "fresh")
+
+        self.assertEqual(self.rebuilds, 1)
+        self.assertEqual({value for value, _ in results}, {"fresh"})
+
+    def test_stale_value_is_served_while_one_worker_rebuilds(self):
+        single_flight("test:key", lambda: "old", 60, version=1)
+
+        results = self.run_in_parallel(2, "new")
+
+        self.assertEqual(self.rebuilds, 1)
+        self.assertEqual(results.count(("new", False)), 1)
+        self.assertEqual(results.count(("old", True)), 9)
+        self.assertEqual(single_flight("test:key", lambda: "newer", 60, 2), ("new", False))
+
+
+class SingleFlightViewTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.listing = create_listing(create_agent())
+        self.url = reverse("single-listing", args=[self.listing.pk])
+
+    def test_parallel_detail_requests_rebuild_once(self):
+        workers = 8
+        start = threading.Barrier(workers)
+        to_representation = ListingSerializer.to_representation
+        rebuilds = []
+
+        def slow_to_representation(serializer, instance):
+            rebuilds.append(instance.pk)
+            time.sleep(0.3)
+            return to_representation(serializer, instance)
+
+        def request():
+            try:
+                start.wait()
+                return Client().get(self.url)
+            finally:
+                connection.close()
+
+        with mock.patch.object(
+            ListingSerializer, "to_representation", slow_to_representation
+        ):
+            with ThreadPoolExecutor(workers) as executor:
+                responses = list(executor.map(lambda _: request(), range(workers)))
+
+        self.assertEqual(rebuilds, [self.listing.pk])
+        self.assertEqual({response.status_code for response in responses}, {200})
+        self.assertEqual({response.data["id"] for response in responses}, {self.listing.pk})
+
+
+class ImageUploadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        self.spool_dir = spool_dir.name
+
+        settings = override_settings(
+            LISTING_IMAGE_SPOOL_DIR=self.spool_dir,
+            LISTING_IMAGE_UPLOADER="listings.tests.fake_upload",
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.agent = create_agent()
+        authenticate(self.client, self.agent.user)
+
+    def post_listing(self, *contents):
+        files = [
+            SimpleUploadedFile(f"photo{index}.jpg", content, "image/jpeg")
+            for index, content in enumerate(contents)
+        ]
+        return self.client.post(
+            reverse("create-listing"),
+            {
+                "name": "Two bedroom flat",
+                "description": "A lovely two bedroom flat",
+                "location": "Lekki, Lagos",
+                "price": 500000,
+                "file": files,
+            },
+        )
+
+    def add_listing(self, *contents):
+        response = self.post_listing(*contents)
+        self.assertEqual(response.status_code, 201)
+        return Listing.objects.get()
+
+    def spooled_files(self):
+        return [name for _, _, names in os.walk(self.spool_dir) for name in names]
+
+    def detail_images(self, listing):
+        response = self.client.get(reverse("single-listing", args=[listing.pk]))
+        return [image["image_url"] for image in response.data["listing_images"]]
+
+    @mock.patch("listings.serializers.upload_listing_images")
+    def test_images_are_uploaded_later(self, task):
+        listing = self.add_listing(b"one", b"two", b"three")
+
+        images = ListingImage.objects.filter(listing=listing)
+        self.assertEqual(images.filter(status=ListingImage.Status.PENDING).count(), 3)
+        self.assertEqual(len(self.spooled_files()), 3)
+        self.assertEqual(self.detail_images(listing), [])
+
+        self.assertEqual(upload_pending_images(listing.pk), [])
+        self.assertEqual(images.filter(status=ListingImage.Status.READY).count(), 3)
+        self.assertEqual(self.spooled_files(), [])
+        self.assertEqual(len(self.detail_images(listing)), 3)
+        image = images.order_by("id").first()
+        self.assertEqual(image.image_file.get_prep_value(), "image/upload/v1/photo0.jpg")
+        self.assertEqual(image.derivatives["thumb"], "https://cdn.test/thumb/photo0.webp")
+
+    def test_remote_images(self):
+        listing = create_listing(self.agent)
+        ListingImage.objects.create(
+            listing=listing,
+            status=ListingImage.Status.PENDING,
+            source_url="https://img.test/remote.jpg",
+        )
+
+        self.assertEqual(upload_pending_images(listing.pk), [])
+        image = ListingImage.objects.get(source_url="", derivatives__thumb__isnull=False)
+        self.assertEqual(image.image_file.public_id, "remote")
+        self.assertEqual(image.status, ListingImage.Status.READY)
+
+    @mock.patch("listings.serializers.upload_listing_images")
+    def test_failed_uploads_are_retried_then_discarded(self, task):
+        listing = self.add_listing(b"one", b"fail")
+        context = mock.Mock(retries=1)
+
+        with self.assertRaises(ImageUploadError):
+            upload_listing_images.call_local(listing.pk, task=context)
+        self.assertEqual(
+            ListingImage.objects.filter(status=ListingImage.Status.PENDING).count(), 1
+        )
+
+        context.retries = 0
+        upload_listing_images.call_local(listing.pk, task=context)
+        self.assertEqual(
+            ListingImage.objects.filter(status=ListingImage.Status.FAILED).count(), 1
+        )
+        self.assertEqual(self.spooled_files(), [])
+        self.assertEqual(len(self.detail_images(listing)), 1)
+
+    @mock.patch("listings.serializers.upload_listing_images")
+    def test_uploads_stream_into_the_spool(self, task):
+        with mock.patch("listings.serializers.spool_images") as spool_images:
+            spool_images.return_value = 0
+            self.add_listing(b"one")
+
+        files = spool_images.call_args[0][1]
+        self.assertIsInstance(files[0], SpooledUploadedFile)
+        self.assertEqual(
+            os.path.dirname(files[0].temporary_file_path()), self.spool_dir
+        )
+
+    @override_settings(LISTING_UPLOAD_MAX_FILE_SIZE=1000)
+    def test_file_size_limit(self):
+        response = self.post_listing(b"small", b"x" * 1001)
+
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Listing.objects.exists())
+        self.assertEqual(self.spooled_files(), [])
+
+    @override_settings(
+        LISTING_UPLOAD_MAX_FILE_SIZE=1000, LISTING_UPLOAD_MAX_REQUEST_SIZE=1500
+    )
+    def test_request_size_limit(self):
+        response = self.post_listing(b"x" * 1000, b"x" * 1000)
+
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Listing.objects.exists())
+
+
+class ImageDeletionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = create_agent()
+        self.listing = create_listing(self.agent)
+
+    @mock.patch("cloudinary.api.delete_resources")
+    def test_deleting_a_listing_queues_its_images(self, delete_resources):
+        authenticate(self.client, self.agent.user)
+        response = self.client.delete(reverse("delete-listing", args=[self.listing.pk]))
+
+        self.assertEqual(response.status_code, 204)
+        delete_resources.assert_not_called()
+        self.assertEqual(
+            sorted(ImageDeletion.objects.values_list("public_id", flat=True)),
+            ["a", "b"],
+        )
+
+    @mock.patch("cloudinary.api.delete_resources")
+    def test_purge_in_batches(self, delete_resources):
+        delete_resources.side_effect = lambda public_ids, **kwargs: {
+            "deleted": {public_id: "deleted" for public_id in public_ids}
+        }
+        self.listing.delete()
+
+        self.assertEqual(purge_deleted_images(batch_size=1), 2)
+        self.assertEqual(delete_resources.call_count, 2)
+        self.assertFalse(ImageDeletion.objects.exists())
+
+    @mock.patch("cloudinary.api.delete_resources")
+    def test_failed_batches_stay_queued(self, delete_resources):
+        delete_resources.side_effect = cloudinary.exceptions.Error("rate limited")
+        self.listing.delete()
+
+        self.assertEqual(purge_deleted_images(), 0)
+        self.assertEqual(
+            list(ImageDeletion.objects.values_list("attempts", flat=True)), [1, 1]
+        )
+
+    @mock.patch("cloudinary.api.delete_resources")
+    def test_failing_images_dont_block_the_queue(self, delete_resources):
+        failing = ImageDeletion.objects.create(public_id="broken")
+        ImageDeletion.objects.create(public_id="given-up", attempts=MAX_DELETE_ATTEMPTS)
+        self.listing.delete()
+        delete_resources.side_effect = lambda public_ids, **kwargs: {
+            "deleted": {
+                public_id: "deleted" for public_id in public_ids if public_id != "broken"
+            }
+        }
+
+        self.assertEqual(purge_deleted_images(batch_size=1), 0)
+        # the failed image moved behind the listing's images
+        self.assertEqual(purge_deleted_images(batch_size=1), 2)
+        failing.refresh_from_db()
+        self.assertEqual(failing.attempts, 2)
+        self.assertEqual(
+            sorted(ImageDeletion.objects.values_list("public_id", flat=True)),
+            ["broken", "given-up"],
+        )
+
+    def test_listing_images_are_queued_in_one_insert(self):
+        ListingImage.objects.create(listing=self.listing)  # not uploaded yet
+        with CaptureQueriesContext(connection) as context:
+            self.listing.delete()
+
+        inserts = [
+            query
+            for query in context.captured_queries
+            if query["sql"].startswith('INSERT INTO "listings_imagedeletion"')
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(ImageDeletion.objects.count(), 2)
+
+    def test_deleting_single_images_queues_them(self):
+        self.listing.images.first().delete()
+        self.listing.images.all().delete()
+
+        self.assertEqual(
+            sorted(ImageDeletion.objects.values_list("public_id", flat=True)),
+            ["a", "b"],
+        )
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.listing = create_listing(create_agent())
+
+    def test_detail_has_a_srcset(self):
+        ListingImage.objects.filter(image_file="image/upload/v1/a.jpg").update(
+            derivatives={
+                "thumb": "https://cdn.test/thumb/a.webp",
+                "card": "https://cdn.test/card/a.webp",
+                "full": "https://cdn.test/full/a.webp",
+            }
+        )
+        response = self.client.get(reverse("single-listing", args=[self.listing.pk]))
+
+        srcsets = sorted(image["srcset"] for image in response.data["listing_images"])
+        self.assertEqual(
+            srcsets[0],
+            "https://cdn.test/thumb/a.webp 320w, https://cdn.test/card/a.webp 800w, "
+            "https://cdn.test/full/a.webp 1600w",
+        )
+        # derivatives of older images are built from their public id
+        self.assertIn("/image/upload/c_fill,h_240,q_auto,w_320/b.webp 320w", srcsets[1])
+
+    def test_lists_only_have_thumbnails(self):
+        response = self.client.get(reverse("all-listings"))
+
+        images = response.data["results"][0]["listing_images"]
+        self.assertEqual(len(images), 2)
+        self.assertEqual(set(images[0]), {"thumbnail_url"})
+        self.assertTrue(images[0]["thumbnail_url"].endswith(".webp"))
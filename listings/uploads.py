@@ -0,0 +1,277 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import cloudinary.api
+import cloudinary.exceptions
+import cloudinary.uploader
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import (
+    IMAGE_DERIVATIVES,
+    ImageDeletion,
+    Listing,
+    ListingImage,
+    derivative_transformation,
+)
+
+# concurrent uploads per task
+UPLOAD_WORKERS = 4
+# the most public ids Cloudinary's delete_resources accepts in one call
+DELETE_BATCH_SIZE = 100
+# images still not deleted after this many purges are left in `ImageDeletion`
+MAX_DELETE_ATTEMPTS = 10
+
+
+def cloudinary_upload(file):
+    return cloudinary.uploader.upload_resource(
+        file,
+        type="upload",
+        resource_type="image",
+        # generated once now instead of on the first request for each size
+        eager=[derivative_transformation(name) for name in IMAGE_DERIVATIVES],
+    )
+
+
+def eager_derivatives(resource):
+    """
+    Derivative urls from an upload response, eager results come back in the
+    order they were requested
+    """
+    eager = (resource.metadata or {}).get("eager", [])
+    return {
+        name: result["secure_url"] for name, result in zip(IMAGE_DERIVATIVES, eager)
+    }
+
+
+def get_uploader():
+    """
+    Callable that takes an open file or a url and returns its `CloudinaryResource`,
+    set by `LISTING_IMAGE_UPLOADER`
+    """
+    return import_string(settings.LISTING_IMAGE_UPLOADER)
+
+
+def get_spool_storage():
+    # the huey workers read the files back, so they must see the same directory
+    return FileSystemStorage(location=settings.LISTING_IMAGE_SPOOL_DIR)
+
+
+class RequestEntityTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "Upload too large."
+    default_code = "request_entity_too_large"
+
+
+class SpooledUploadedFile(UploadedFile):
+    """
+    An upload written straight into the spool directory, so `spool_images` only
+    has to rename it
+    """
+
+    def __init__(self, name, content_type, charset, content_type_extra=None):
+        os.makedirs(settings.LISTING_IMAGE_SPOOL_DIR, exist_ok=True)
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(
+            suffix=".upload" + ext, dir=settings.LISTING_IMAGE_SPOOL_DIR
+        )
+        super().__init__(file, name, content_type, 0, charset, content_type_extra)
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            # already moved into the spool storage
+            pass
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    """
+    Writes every chunk to disk as it arrives, so no upload is held in memory.
+    `LISTING_UPLOAD_MAX_FILE_SIZE` and `LISTING_UPLOAD_MAX_REQUEST_SIZE` are
+    checked as the body streams in, going over either aborts with a 413.
+
+    Override `open_sink` to write uploads somewhere else.
+    """
+
+    chunk_size = 64 * 2 ** 10
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_file_size = settings.LISTING_UPLOAD_MAX_FILE_SIZE
+        self.max_request_size = settings.LISTING_UPLOAD_MAX_REQUEST_SIZE
+        self.request_size = 0
+
+    def handle_raw_input(
+        self, input_data, META, content_length, boundary, encoding=None
+    ):
+        # reject early when the client announces the size
+        if content_length > self.max_request_size:
+            raise RequestEntityTooLarge()
+
+    def open_sink(self):
+        return SpooledUploadedFile(
+            self.file_name, self.content_type, self.charset, self.content_type_extra
+        )
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = self.open_sink()
+        self.file_size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file_size += len(raw_data)
+        self.request_size += len(raw_data)
+        if self.file_size > self.max_file_size:
+            self.file.close()
+            raise RequestEntityTooLarge(
+                f"{self.file_name} is larger than {self.max_file_size} bytes."
+            )
+        if self.request_size > self.max_request_size:
+            self.file.close()
+            raise RequestEntityTooLarge(
+                f"Uploads are limited to {self.max_request_size} bytes per request."
+            )
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        return self.file
+
+
+def spool_images(listing, files):
+    """
+    Write uploaded files to the spool storage and create their pending rows in
+    a single INSERT. Returns the number of images spooled.
+    """
+    storage = get_spool_storage()
+    images = [
+        ListingImage(
+            listing=listing,
+            status=ListingImage.Status.PENDING,
+            spool_name=storage.save(
+                os.path.join(str(listing.pk), os.path.basename(file.name)), file
+            ),
+        )
+        for file in files
+    ]
+    ListingImage.objects.bulk_create(images)
+    return len(images)
+
+
+def upload_pending_images(listing_id, workers=UPLOAD_WORKERS):
+    """
+    Upload the pending images of a listing concurrently, then mark the ones that
+    succeeded ready in one UPDATE. Returns the images that failed, which stay
+    pending so they can be retried.
+    """
+    pending = list(
+        ListingImage.objects.filter(
+            listing_id=listing_id, status=ListingImage.Status.PENDING
+        )
+    )
+    if not pending:
+        return []
+
+    storage = get_spool_storage()
+    upload = get_uploader()
+
+    def upload_image(image):
+        if image.source_url:
+            return upload(image.source_url)
+        with storage.open(image.spool_name) as file:
+            return upload(file)
+
+    uploaded, failed = [], []
+    with ThreadPoolExecutor(max_workers=min(workers, len(pending))) as executor:
+        futures = {executor.submit(upload_image, image): image for image in pending}
+        for future in as_completed(futures):
+            image = futures[future]
+            try:
+                image.image_file = future.result()
+            except (cloudinary.exceptions.Error, OSError):
+                failed.append(image)
+            else:
+                image.derivatives = eager_derivatives(image.image_file)
+                image.status = ListingImage.Status.READY
+                uploaded.append(image)
+
+    if uploaded:
+        for image in uploaded:
+            if image.spool_name:
+                storage.delete(image.spool_name)
+            image.spool_name = image.source_url = ""
+        ListingImage.objects.bulk_update(
+            uploaded, ["image_file", "derivatives", "status", "spool_name", "source_url"]
+        )
+        # bulk_update skips `touch_listing`, the cached listing must still change
+        Listing.objects.filter(pk=listing_id).update(updated_on=timezone.now())
+    return failed
+
+
+def discard_images(images):
+    """
+    Give up on images that could not be uploaded
+    """
+    storage = get_spool_storage()
+    for image in images:
+        if image.spool_name:
+            storage.delete(image.spool_name)
+    ListingImage.objects.filter(pk__in=[image.pk for image in images]).update(
+        status=ListingImage.Status.FAILED, spool_name="", source_url=""
+    )
+
+
+def purge_deleted_images(batch_size=DELETE_BATCH_SIZE):
+    """
+    Delete the images recorded in `ImageDeletion` from Cloudinary, one API call
+    per batch. Returns the number of images purged. Images that couldn't be
+    deleted go to the back of the queue and are left there after
+    `MAX_DELETE_ATTEMPTS`.
+    """
+    purged = 0
+    while True:
+        with transaction.atomic():
+            # skip_locked lets a slow purge overlap with the next scheduled one
+            batch = list(
+                ImageDeletion.objects.select_for_update(skip_locked=True)
+                .filter(attempts__lt=MAX_DELETE_ATTEMPTS)
+                .order_by("attempts", "pk")
+                .values_list("pk", "public_id")[:batch_size]
+            )
+            if not batch:
+                return purged
+
+            try:
+                response = cloudinary.api.delete_resources(
+                    [public_id for _, public_id in batch],
+                    resource_type="image",
+                    type="upload",
+                )
+            except cloudinary.exceptions.Error:
+                deleted = {}
+            else:
+                # "not_found" is as good as deleted
+                deleted = response.get("deleted", {})
+
+            done = [pk for pk, public_id in batch if public_id in deleted]
+            ImageDeletion.objects.filter(pk__in=done).delete()
+            ImageDeletion.objects.filter(
+                pk__in=[pk for pk, _ in batch if pk not in done]
+            ).update(attempts=models.F("attempts") + 1)
+            purged += len(done)
+            if len(done) < len(batch):
+                # tried again on the next run, after the images queued since
+                return purged
@@ -5,6 +5,10 @@ from . import views
 urlpatterns = [
     path("listings/<int:pk>/add_review/", views.add_review, name="add-review"),
     path("listings/saved/", views.SavedListingsView.as_view(), name="saved-listings"),
+    path("listings/saved/ids/", views.saved_listing_ids, name="saved-listing-ids"),
+    path(
+        "listings/saved/bulk/", views.bulk_save_listings, name="bulk-save-listings"
+    ),
     path("listings/<int:pk>/save/", views.save_listing, name="add-listing-to-saved"),
     path(
         "listings/<int:pk>/unsave/",
@@ -13,6 +17,11 @@ urlpatterns = [
     ),
     path("listings/create/", views.AddListingView.as_view(), name="create-listing"),
     path("listings/", views.AllListingsView.as_view(), name="all-listings"),
+    path("listings/batch/", views.ListingBatchView.as_view(), name="listing-batch"),
+    path("listings/export/", views.export_listings, name="export-listings"),
+    path(
+        "listings/changes/", views.ListingChangesView.as_view(), name="listing-changes"
+    ),
     path(
         "listings/<int:pk>/",
         views.SingleListingView.as_view(),
@@ -24,4 +33,9 @@ urlpatterns = [
         name="delete-listing",
     ),
     path("listings/search/", views.SearchListingView.as_view(), name="search-listing"),
+    path(
+        "listings/search/stats/",
+        views.search_cache_stats,
+        name="search-cache-stats",
+    ),
 ]
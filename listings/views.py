@@ -1,14 +1,94 @@
+import hashlib
+from calendar import timegm
+from datetime import timedelta
+
+from django.db.models import F
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.functional import cached_property
+from django.utils.http import http_date, quote_etag
 from rest_framework import generics
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
 from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 
 from accounts.permission import CustomIsAuthenticated
-from .models import Listing
+from . import export
+from .cache import (
+    get_listing_detail,
+    get_saved_ids,
+    get_search_results,
+    get_search_stats,
+)
+from .filters import ListingFilter
+from .models import Listing, ListingTombstone, SavedListing
+from .pagination import ChangeFeedPagination, KeysetPagination
 from .permission import AgentOnly, UserOnly, OwnerOnly
-from .serializers import ListingSerializer, ReviewSerializer
+from .serializers import (
+    BulkSaveSerializer,
+    ListingSerializer,
+    ReviewSerializer,
+    select_listing_fields,
+)
+from .uploads import StreamingUploadHandler
+
+
+class ConditionalGetMixin:
+    """
+    ETag/Last-Modified support for GET. `get_validators` returns the listing
+    version the response would be built from, so unchanged resources are
+    answered with a 304 before anything is serialized.
+    """
+
+    def get_validators(self):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        validators = {"etag": quote_etag(etag), "last_modified": None}
+        if last_modified:
+            validators["last_modified"] = timegm(last_modified.utctimetuple())
+        not_modified = get_conditional_response(request, **validators)
+        if not_modified is not None:
+            return not_modified
+
+        response = super().get(request, *args, **kwargs)
+        # a stale body doesn't match the current version, don't let clients keep it
+        if getattr(self, "is_stale", False):
+            response["Cache-Control"] = "no-cache"
+            return response
+
+        response["ETag"] = validators["etag"]
+        if validators["last_modified"]:
+            response["Last-Modified"] = http_date(validators["last_modified"])
+        return response
+
+
+class SparseFieldsetMixin:
+    """
+    For list views, renders the `?fields=` or `?expand=` subset of the listing
+    fields, see `listings.serializers.select_listing_fields`
+    """
+
+    @cached_property
+    def listing_fields(self):
+        return select_listing_fields(self.request.query_params)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["listing_fields"] = self.listing_fields
+        return context
+
+    def prune_queryset(self, queryset):
+        # the only large column a list can do without
+        if "description" not in self.listing_fields:
+            return queryset.defer("description")
+        return queryset
 
 
 class AddListingView(generics.CreateAPIView):
@@ -17,6 +97,12 @@ class AddListingView(generics.CreateAPIView):
     parser_classes = (MultiPartParser,)
     permission_classes = [CustomIsAuthenticated, AgentOnly]
 
+    def initialize_request(self, request, *args, **kwargs):
+        # must be set before the body is read, which only happens after the
+        # permission checks
+        request.upload_handlers = [StreamingUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -29,55 +115,80 @@ class AddListingView(generics.CreateAPIView):
         )
 
 
-class AllListingsView(generics.ListAPIView):
+class AllListingsView(ConditionalGetMixin, SparseFieldsetMixin, generics.ListAPIView):
     """
     For filtering results...
     e.g https://ecx-property-hub.herokuapp.com/?price=100000&is_furnished=1
     price: For 1m+, pass 1000001 as query value e.g price=1000001
     bathrooms: For 4+ bathrooms, pass 5 as query value e.g bathrooms=5
     bedrooms: For 4+ bedrooms, pass 5 as query value e.g bedrooms=5
-    is_furnished: Pass 1 or 0 to represent value
+    is_furnished, is_new: Pass 1 or 0 to represent value
+    price_min, price_max, bedrooms_min, bedrooms_max, bathrooms_min, bathrooms_max: inclusive ranges
+    bedrooms_in, bathrooms_in: comma separated values e.g bedrooms_in=2,3
+    location: matches locations starting with the value e.g location=Lekki
+    ordering: one of created_on, -created_on, price, -price
+    Any filter can be passed as "Any" to ignore it.
+    fields: comma separated listing fields to return e.g fields=id,name,price
+    expand: fields to add to the compact default e.g expand=agent,reviews,description
     """
     serializer_class = ListingSerializer
-    queryset = Listing.objects.all()
+    queryset = Listing.objects.for_list()
+    pagination_class = KeysetPagination
+
+    @property
+    def keyset_ordering(self):
+        return ListingFilter(self.request.query_params).get_ordering()
 
     # filter result
     def get_queryset(self):
-        queries = self.request.query_params
-        if len(queries) < 1:
-            return self.queryset.all()
-        else:
-            model = self.queryset.all()
-            price = queries.get('price', None)
-            bedrooms = queries.get('bedrooms', None)
-            bathrooms = queries.get('bathrooms', None)
-            is_furnished = queries.get('is_furnished', None)
-
-            if price and price != 'Any':
-                if price > 1000000:
-                    model.filter(price__gte=price)
-                else:
-                    model.filter(price__lte=price)
-
-            if bedrooms and bedrooms != 'Any':
-                if bedrooms > 5:
-                    model.filter(bedrooms__gte=bedrooms)
-                else:
-                    model.filter(bedrooms__lte=bedrooms)
-
-            if bathrooms and bathrooms != 'Any':
-                if bathrooms > 5:
-                    model.filter(bathrooms__gte=bathrooms)
-                else:
-                    model.filter(bathrooms__lte=bathrooms)
-
-            if is_furnished and is_furnished != 'Any':
-                model.filter(is_furnished=bool(is_furnished))
-
-
-class SingleListingView(generics.RetrieveAPIView):
+        return self.prune_queryset(
+            ListingFilter(self.request.query_params).filter_queryset(
+                self.queryset.all()
+            )
+        )
+
+    @cached_property
+    def page(self):
+        return super().paginate_queryset(self.filter_queryset(self.get_queryset()))
+
+    def paginate_queryset(self, queryset):
+        # fetched once, for the validators and then the response
+        return self.page
+
+    def get_validators(self):
+        # the page's own keyset window is its version, changes to listings on other
+        # pages don't affect it. No Last-Modified, a listing leaving the page
+        # doesn't move the newest updated_on of the ones left.
+        versions = [
+            (listing.pk, listing.updated_on.timestamp()) for listing in self.page
+        ]
+        etag = f"{self.request.get_full_path()}:{versions}:{self.paginator.has_next}"
+        return hashlib.md5(etag.encode()).hexdigest(), None
+
+
+class SingleListingView(ConditionalGetMixin, generics.RetrieveAPIView):
     serializer_class = ListingSerializer
-    queryset = Listing.objects.all()
+    queryset = Listing.objects.with_related()
+
+    def get_validators(self):
+        updated_on = (
+            Listing.objects.filter(pk=self.kwargs["pk"])
+            .values_list("updated_on", flat=True)
+            .first()
+        )
+        if updated_on is None:
+            raise Http404
+        self.version = updated_on.timestamp()
+        return f"{self.kwargs['pk']}-{self.version}", updated_on
+
+    def retrieve(self, request, *args, **kwargs):
+        # served from the cache, one worker rebuilds while others serve a stale copy
+        data, self.is_stale = get_listing_detail(
+            self.kwargs["pk"],
+            self.version,
+            lambda: self.get_serializer(self.get_object()).data,
+        )
+        return Response(data)
 
 
 class DestroyListingView(generics.DestroyAPIView):
@@ -94,50 +205,170 @@ class DestroyListingView(generics.DestroyAPIView):
         )
 
 
-class SavedListingsView(generics.ListAPIView):
+class ListingBatchView(SparseFieldsetMixin, generics.GenericAPIView):
+    """
+    Up to 50 listings by id in one request, in the order asked for.
+    e.g https://ecx-property-hub.herokuapp.com/api/listings/batch/?ids=3,1,2
+    Ids without a listing are returned in "missing". fields and expand work as
+    for the other lists.
+    """
+    serializer_class = ListingSerializer
+    queryset = Listing.objects.for_list()
+    max_ids = 50
+
+    def get_ids(self):
+        ids = []
+        for value in self.request.query_params.get("ids", "").split(","):
+            value = value.strip()
+            if not value:
+                continue
+            try:
+                pk = int(value)
+            except ValueError:
+                raise ValidationError({"ids": f"Invalid id: {value}"})
+            if pk not in ids:
+                ids.append(pk)
+
+        if not ids:
+            raise ValidationError({"ids": "This query parameter is required."})
+        if len(ids) > self.max_ids:
+            raise ValidationError({"ids": f"At most {self.max_ids} ids are allowed."})
+        return ids
+
+    def get(self, request, *args, **kwargs):
+        ids = self.get_ids()
+        # a single query, the fragment cache covers the related objects
+        listings = self.prune_queryset(self.get_queryset()).in_bulk(ids)
+
+        serializer = self.get_serializer(
+            [listings[pk] for pk in ids if pk in listings], many=True
+        )
+        return Response(
+            {
+                "results": serializer.data,
+                "missing": [pk for pk in ids if pk not in listings],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class ListingChangesView(SparseFieldsetMixin, generics.GenericAPIView):
+    """
+    Change feed for keeping a copy of the listings in sync.
+    Start with https://ecx-property-hub.herokuapp.com/api/listings/changes/ and
+    keep following "next", which always points past the last change served.
+    Each change is either {"id": 1, "deleted": false, "listing": {...}} or
+    {"id": 1, "deleted": true}. fields and expand work as for the other lists.
+    A cursor older than 30 days gets a 410, sync from the start again.
+    """
+    serializer_class = ListingSerializer
+    pagination_class = ChangeFeedPagination
+    # changes this recent may belong to transactions that haven't committed yet,
+    # they're served on the next poll so none is skipped
+    settle_delay = timedelta(seconds=5)
+
+    def get(self, request, *args, **kwargs):
+        until = timezone.now() - self.settle_delay
+        listings = (
+            self.prune_queryset(Listing.objects.for_list())
+            .annotate(changed_on=F("updated_on"), changed_id=F("id"))
+            .filter(changed_on__lte=until)
+        )
+        tombstones = ListingTombstone.objects.annotate(
+            changed_on=F("deleted_on"), changed_id=F("listing_id")
+        ).filter(changed_on__lte=until)
+
+        page = self.paginator.paginate_changes([listings, tombstones], request, self)
+        updated = [row for row in page if isinstance(row, Listing)]
+        representations = iter(self.get_serializer(updated, many=True).data)
+
+        changes = []
+        for row in page:
+            if isinstance(row, Listing):
+                change = {"deleted": False, "listing": next(representations)}
+            else:
+                change = {"deleted": True}
+            changes.append({"id": row.changed_id, **change})
+        return self.paginator.get_paginated_response(changes)
+
+
+class SavedListingsView(SparseFieldsetMixin, generics.ListAPIView):
+    """
+    Listings saved by the current user, most recently saved first
+    """
     permission_classes = [CustomIsAuthenticated]
     serializer_class = ListingSerializer
-    queryset = Listing.objects.all()
+    queryset = Listing.objects.for_list()
+    pagination_class = KeysetPagination
+    keyset_ordering = ("-saved_at", "-id")
 
     def get_queryset(self):
-        return self.request.user.listing_likes.all()
+        return self.prune_queryset(
+            self.queryset.filter(saves__user=self.request.user).annotate(
+                saved_at=F("saves__saved_at")
+            )
+        )
 
 
 @api_view(["POST"])
 @permission_classes([CustomIsAuthenticated])
 def save_listing(request, pk):
-    listing = get_object_or_404(Listing, id=pk)
-
-    # check if listing has been saved already
-    if listing.likes.filter(id=request.user.id).exists():
-        return Response(
-            {"detail": "You already saved this listing"},
-            status=status.HTTP_400_BAD_REQUEST,
-        )
+    # idempotent, saving an already saved listing is a no-op
+    if not SavedListing.objects.save_listings(request.user, [pk]):
+        get_object_or_404(Listing, id=pk)
 
-    listing.likes.add(request.user)
     return Response(
-        {"detail": "Listing saved successfully"}, status=status.HTTP_400_BAD_REQUEST
+        {"detail": "Listing saved successfully"}, status=status.HTTP_200_OK
     )
 
 
 @api_view(["POST"])
 @permission_classes([CustomIsAuthenticated])
 def unsave_listing(request, pk):
-    listing = get_object_or_404(Listing, id=pk)
+    # idempotent, unsaving a listing that isn't saved is a no-op
+    if not SavedListing.objects.unsave_listings(request.user, [pk]):
+        get_object_or_404(Listing, id=pk)
 
-    # check if listing has been saved already
-    if not listing.likes.filter(id=request.user.id).exists():
-        return Response(
-            {"detail": "This listing has not been saved"},
-            status=status.HTTP_400_BAD_REQUEST,
-        )
-
-    listing.likes.add(request.user)
     return Response(
         {"detail": "Listing removed from saved successfully"},
-        status=status.HTTP_400_BAD_REQUEST,
+        status=status.HTTP_200_OK,
+    )
+
+
+@api_view(["POST"])
+@permission_classes([CustomIsAuthenticated])
+def bulk_save_listings(request):
+    """
+    Save and unsave many listings in one request, unknown ids are ignored.
+    Sample request:
+    {
+        "save": [1, 2, 3],
+        "unsave": [4]
+    }
+    """
+    serializer = BulkSaveSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+
+    saved = SavedListing.objects.save_listings(
+        request.user, serializer.validated_data["save"]
+    )
+    unsaved = SavedListing.objects.unsave_listings(
+        request.user, serializer.validated_data["unsave"]
     )
+    return Response({"saved": saved, "unsaved": unsaved}, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@permission_classes([CustomIsAuthenticated])
+def saved_listing_ids(request):
+    """
+    Ids of every listing saved by the current user
+    """
+    ids = get_saved_ids(
+        request.user.pk,
+        lambda: request.user.saved_listings.values_list("listing_id", flat=True),
+    )
+    return Response({"ids": ids}, status=status.HTTP_200_OK)
 
 
 @api_view(["POST"])
@@ -162,14 +393,69 @@ def add_review(request, pk):
     )
 
 
-class SearchListingView(generics.ListAPIView):
+class SearchListingView(SparseFieldsetMixin, generics.ListAPIView):
     """
     Example: https://ecx-property-hub.herokuapp.com/api/listings/search/?q=two+bedroom+flat
     """
     serializer_class = ListingSerializer
     queryset = Listing
+    pagination_class = KeysetPagination
+    keyset_ordering = ("-rank", "-id")
 
     def get_queryset(self):
         search_query = self.request.query_params.get("q", None)
-        qs = self.queryset.objects.search(search_query)
+        qs = self.queryset.objects.search(search_query or "").for_list()
+        if not search_query:
+            return qs.none()
         return qs
+
+    def list(self, request, *args, **kwargs):
+        search_query = self.request.query_params.get("q", None)
+        if not search_query:
+            return super().list(request, *args, **kwargs)
+
+        # rank and order from the cache, then only fetch the listings on this page
+        queryset = self.queryset.objects.search(search_query)
+        rows = get_search_results(
+            search_query, lambda: queryset.values_list("rank", "id")
+        )
+        page = self.paginator.paginate_rows(rows, request, view=self, queryset=queryset)
+        listings = self.prune_queryset(Listing.objects.for_list()).in_bulk(
+            [pk for _, pk in page]
+        )
+
+        serializer = self.get_serializer(
+            [listings[pk] for _, pk in page if pk in listings], many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def search_cache_stats(request):
+    """
+    Hit/miss counters of the search result cache
+    """
+    return Response(get_search_stats(), status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def export_listings(request):
+    """
+    Streams every listing, with its agent and image urls, as NDJSON or CSV.
+    e.g https://ecx-property-hub.herokuapp.com/api/listings/export/?output=csv&location=Lekki
+    output: ndjson (default) or csv
+    Accepts the same filters as the listings endpoint.
+    """
+    output = request.query_params.get("output", "ndjson")
+    if output not in export.FORMATS:
+        raise ValidationError({"output": f"Must be one of {', '.join(export.FORMATS)}"})
+    lines, content_type = export.FORMATS[output]
+
+    queryset = ListingFilter(request.query_params).filter_queryset(Listing.objects.all())
+    response = StreamingHttpResponse(
+        export.batched(lines(export.export_rows(queryset))), content_type=content_type
+    )
+    response["Content-Disposition"] = f'attachment; filename="listings.{output}"'
+    return response
@@ -0,0 +1,244 @@
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from mimesis.schema import Field
+from rest_framework.authtoken.models import Token
+
+from accounts.models import Agent, CustomUser
+from listings.cache import bump_generation
+from listings.models import Listing, ListingImage, Review, SavedListing
+from mock import schemas
+
+# how far back the seeded listings' created_on is spread
+TIMELINE = timedelta(days=365)
+
+
+def skewed_weights(count, skew):
+    """
+    Cumulative Zipf weights for `random.choices`, the first items are picked most.
+    A `skew` of 0 is uniform.
+    """
+    return list(accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with synthetic customers, agents, listings, reviews and "
+        "likes for load testing. Agents and listings are picked with a Zipf skew, "
+        "so a few are far more popular than the rest. The same --seed on the same "
+        "database gives the same data, use another seed to add more."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument("--agents", type=int, default=200)
+        parser.add_argument("--listings", type=int, default=20000)
+        parser.add_argument("--reviews", type=int, default=50000)
+        parser.add_argument("--likes", type=int, default=100000)
+        parser.add_argument(
+            "--images", type=int, default=3, help="Most images per listing."
+        )
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.1,
+            help="Zipf exponent of agent and listing popularity, 0 is uniform.",
+        )
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        self.seed = options["seed"]
+        self.random = random.Random(self.seed)
+        self.field = Field("en", seed=self.seed)
+        self.batch_size = options["batch_size"]
+        self.now = timezone.now()
+        # hashing is deliberately slow, every seeded user shares one "password"
+        self.password = make_password("password")
+
+        customers = self.create_users(options["users"], "customer")
+        agents = self.create_agents(options["agents"])
+        listings = self.create_listings(
+            options["listings"], agents, options["images"], options["skew"]
+        )
+        if listings:
+            self.create_reviews(options["reviews"], customers, listings, options["skew"])
+            self.create_likes(options["likes"], customers, listings, options["skew"])
+            self.finish_listings(listings)
+            bump_generation()
+
+        self.stdout.write(self.style.SUCCESS("Done."))
+
+    def insert(self, label, model, objects, **kwargs):
+        """
+        bulk_create `objects` in batches, returns the created primary keys.
+        Only one batch of instances is held at a time.
+        """
+        started = time.monotonic()
+        pks = []
+        objects = iter(objects)
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                break
+            pks.extend(obj.pk for obj in model.objects.bulk_create(batch, **kwargs))
+
+        elapsed = time.monotonic() - started
+        rate = len(pks) / elapsed if elapsed else 0
+        self.stdout.write(f"{label}: {len(pks)} rows ({rate:.0f} rows/sec)")
+        return pks
+
+    def pick(self, population, weights, count):
+        return self.random.choices(population, cum_weights=weights, k=count)
+
+    def create_users(self, count, kind, **flags):
+        flags = flags or {"is_customer": True}
+
+        def users():
+            for index in range(count):
+                data = schemas.user(self.field)
+                yield CustomUser(
+                    # unique per seed, the generated address alone isn't
+                    email=f"{kind}{index}.s{self.seed}.{data['email']}",
+                    first_name=data["first_name"],
+                    last_name=data["last_name"],
+                    password=self.password,
+                    is_confirmed=True,
+                    **flags,
+                )
+
+        with transaction.atomic():
+            ids = self.insert(f"{kind}s", CustomUser, users())
+            # bulk_create skips the post_save receiver that creates tokens
+            self.insert(
+                f"{kind} tokens",
+                Token,
+                (
+                    Token(key=f"{self.random.getrandbits(160):040x}", user_id=pk)
+                    for pk in ids
+                ),
+            )
+        return ids
+
+    def create_agents(self, count):
+        ids = self.create_users(count, "agent", is_agent=True)
+
+        def agents():
+            for index, pk in enumerate(ids):
+                data = schemas.agent(self.field)
+                yield Agent(
+                    user_id=pk,
+                    phone_number=data["phone_number"][:11],
+                    agent_display_name=(
+                        f"{data['agent_display_name']} {index}.s{self.seed}"
+                    )[-150:],
+                )
+
+        self.insert("agent profiles", Agent, agents())
+        return ids
+
+    def create_listings(self, count, agents, max_images, skew):
+        if not agents:
+            return []
+        weights = skewed_weights(len(agents), skew)
+
+        def listings():
+            for agent_id in self.pick(agents, weights, count):
+                data = schemas.listing(self.field, images=0)
+                yield Listing(
+                    agent_id=agent_id,
+                    name=data["name"][:150],
+                    description=data["description"][:500],
+                    location=data["location"][:100],
+                    # most listings are modest, a few are very expensive
+                    price=int(round(self.random.lognormvariate(13, 0.8), -3)),
+                    is_new=data["is_new"],
+                    is_furnished=self.random.random() < 0.4,
+                    bedrooms=data["bedrooms"],
+                    bathrooms=data["bathrooms"],
+                    lounges=data["lounges"],
+                )
+
+        ids = self.insert("listings", Listing, listings())
+
+        def images():
+            for pk in ids:
+                for index in range(self.random.randint(0, max_images)):
+                    yield ListingImage(
+                        listing_id=pk, image_file=f"image/upload/v1/seed/{pk}-{index}.jpg"
+                    )
+
+        self.insert("listing images", ListingImage, images())
+        return ids
+
+    def popular_listings(self, listings, skew):
+        # shuffled so popularity doesn't follow creation order
+        population = list(listings)
+        self.random.shuffle(population)
+        return population, skewed_weights(len(population), skew)
+
+    def create_reviews(self, count, customers, listings, skew):
+        if not customers:
+            return
+        population, weights = self.popular_listings(listings, skew)
+
+        def reviews():
+            for listing_id in self.pick(population, weights, count):
+                yield Review(
+                    listing_id=listing_id,
+                    user_id=self.random.choice(customers),
+                    message=self.field("text.sentence")[:180],
+                )
+
+        self.insert("reviews", Review, reviews())
+
+    def create_likes(self, count, customers, listings, skew):
+        if not customers:
+            return
+        population, weights = self.popular_listings(listings, skew)
+
+        def likes():
+            for listing_id in self.pick(population, weights, count):
+                yield SavedListing(
+                    user_id=self.random.choice(customers),
+                    listing_id=listing_id,
+                    saved_at=self.now - TIMELINE * self.random.random(),
+                )
+
+        # repeated (user, listing) pairs are dropped by the unique constraint
+        self.insert("likes", SavedListing, likes(), ignore_conflicts=True)
+
+    def finish_listings(self, listings):
+        """
+        Spread created_on over `TIMELINE` (auto_now_add stamped every row with
+        the insert time) and count the likes, both set-wise per batch. Only the
+        listings created by this run are updated.
+        """
+        started = time.monotonic()
+        listings = sorted(listings)
+        first, last = listings[0], listings[-1]
+        spacing = TIMELINE / max(last - first, 1)
+        table = connection.ops.quote_name(Listing._meta.db_table)
+
+        for start in range(0, len(listings), self.batch_size):
+            batch = listings[start : start + self.batch_size]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    UPDATE {table}
+                    SET created_on = %(now)s - (%(last)s - id) * %(spacing)s,
+                        updated_on = %(now)s - (%(last)s - id) * %(spacing)s
+                    WHERE id = ANY(%(ids)s)
+                    """,
+                    {"now": self.now, "last": last, "spacing": spacing, "ids": batch},
+                )
+            Listing.objects.filter(pk__in=batch).recount_likes()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"listing timeline and like counts: {elapsed:.1f}s")
@@ -0,0 +1,48 @@
+"""
+Fake data in the shapes the API returns, shared by the mock endpoints and the
+`seed_scale` command. Each function takes a mimesis `Field` and returns one
+freshly generated object.
+"""
+
+
+def user(_, date_joined=True):
+    data = {
+        "email": _("person.email", domains=["test.com"], key=str.lower),
+        "first_name": _("person.name"),
+        "last_name": _("person.surname"),
+        "image_url": _("person.avatar"),
+    }
+    if date_joined:
+        data["date_joined"] = _("timestamp", posix=False)
+    return data
+
+
+def agent(_, date_joined=True):
+    return {
+        "user": user(_, date_joined=date_joined),
+        "phone_number": _("person.telephone"),
+        "agent_display_name": _("business.company"),
+    }
+
+
+def listing(_, images=3):
+    return {
+        "name": _("text.sentence"),
+        "description": _("text"),
+        "lounges": _("numbers.integer_number", start=0, end=8),
+        "is_new": _("development.boolean"),
+        "bedrooms": _("numbers.integer_number", start=0, end=6),
+        "bathrooms": _("numbers.integer_number", start=0, end=8),
+        "no_of_likes": _("numbers.integer_number", start=0, end=100),
+        "location": _("address"),
+        "listing_images": [{"image_url": _("person.avatar")} for _i in range(images)],
+        "created_on": _("timestamp", posix=False),
+    }
+
+
+def review(_):
+    return {
+        "user": user(_),
+        "timestamp": _("timestamp", posix=False),
+        "message": _("text.sentence"),
+    }
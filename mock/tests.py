@@ -1,3 +1,84 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import Count
 from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import Agent, CustomUser
+from listings.models import Listing, Review, SavedListing
+from mock.management.commands.seed_scale import Command
+
+
+class SeedScaleTests(TestCase):
+    def seed(self, seed=1):
+        call_command(
+            "seed_scale",
+            users=20,
+            agents=3,
+            listings=30,
+            reviews=40,
+            likes=80,
+            seed=seed,
+            batch_size=7,
+            stdout=StringIO(),
+        )
+
+    def test_counts(self):
+        self.seed()
+
+        self.assertEqual(CustomUser.objects.filter(is_customer=True).count(), 20)
+        self.assertEqual(Agent.objects.count(), 3)
+        self.assertEqual(Listing.objects.count(), 30)
+        self.assertEqual(Review.objects.count(), 40)
+        self.assertTrue(0 < SavedListing.objects.count() <= 80)
+        # seeded users can authenticate
+        self.assertEqual(CustomUser.objects.filter(auth_token__isnull=True).count(), 0)
+
+    def test_like_counts_are_reconciled(self):
+        self.seed()
+
+        drifted = Listing.objects.with_like_count_drift()
+        self.assertFalse(drifted.exists())
+        self.assertEqual(
+            sum(Listing.objects.values_list("like_count", flat=True)),
+            SavedListing.objects.count(),
+        )
+
+    def test_created_on_is_spread_out(self):
+        self.seed()
+
+        self.assertEqual(
+            Listing.objects.values("created_on").distinct().count(), 30
+        )
+
+    def test_same_seed_same_data(self):
+        self.seed()
+        first = list(Listing.objects.order_by("id").values_list("name", "price"))
+        CustomUser.objects.all().delete()
+
+        self.seed()
+        second = list(Listing.objects.order_by("id").values_list("name", "price"))
+        self.assertEqual(first, second)
+
+    def test_popular_agents(self):
+        self.seed()
+
+        counts = sorted(
+            Agent.objects.annotate(count=Count("listings")).values_list(
+                "count", flat=True
+            )
+        )
+        self.assertGreater(counts[-1], counts[0])
+
+    def test_only_the_runs_listings_are_rewritten(self):
+        self.seed()
+        first, other, last = Listing.objects.order_by("id")[:3]
+        created_on = other.created_on
+
+        command = Command(stdout=StringIO())
+        command.now, command.batch_size = timezone.now(), 2
+        command.finish_listings([first.pk, last.pk])
 
-# Create your tests here.
+        other.refresh_from_db()
+        self.assertEqual(other.created_on, created_on)
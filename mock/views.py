@@ -3,6 +3,8 @@ from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
+from . import schemas
+
 _ = Field("en")
 
 
@@ -11,30 +13,8 @@ def listings(request):
     schema = Schema(
         schema=lambda: {
             "id": _("uuid"),
-            "name": _("text.sentence"),
-            "description": _("text"),
-            "lounges": _("numbers.integer_number", start=0, end=8),
-            "is_new": _("development.boolean"),
-            "bedrooms": _("numbers.integer_number", start=0, end=6),
-            "bathrooms": _("numbers.integer_number", start=0, end=8),
-            "no_of_likes": _("numbers.integer_number", start=0, end=100),
-            "location": _("address"),
-            "listing_images": [
-                {"image_url": _("person.avatar")},
-                {"image_url": _("person.avatar")},
-                {"image_url": _("person.avatar")},
-            ],
-            "created_on": _("timestamp", posix=False),
-            "agent": {
-                "user": {
-                    "email": _("person.email", domains=["test.com"], key=str.lower),
-                    "first_name": _("person.name"),
-                    "last_name": _("person.surname"),
-                    "image_url": _("person.avatar"),
-                },
-                "phone_number": _("person.telephone"),
-                "agent_display_name": _("business.company"),
-            },
+            **schemas.listing(_),
+            "agent": schemas.agent(_, date_joined=False),
         }
     )
 
@@ -47,88 +27,9 @@ def listing(request, pk: int):
     schema = Schema(
         schema=lambda: {
             "id": pk,
-            "name": _("text.sentence"),
-            "description": _("text"),
-            "is_new": _("development.boolean"),
-            "bedrooms": _("numbers.integer_number", start=0, end=6),
-            "bathrooms": _("numbers.integer_number", start=0, end=8),
-            "lounges": _("numbers.integer_number", start=0, end=8),
-            "no_of_likes": _("numbers.integer_number", start=0, end=100),
-            "location": _("address"),
-            "listing_images": [
-                {"image_url": _("person.avatar")},
-                {"image_url": _("person.avatar")},
-                {"image_url": _("person.avatar")},
-            ],
-            "created_on": _("timestamp", posix=False),
-            "reviews": [
-                {
-                    "user": {
-                        "email": _("person.email", domains=["test.com"], key=str.lower),
-                        "first_name": _("person.name"),
-                        "last_name": _("person.surname"),
-                        "image_url": _("person.avatar"),
-                        "date_joined": _("timestamp", posix=False),
-                    },
-                    "timestamp": _("timestamp", posix=False),
-                    "message": _("text.sentence"),
-                },
-                {
-                    "user": {
-                        "email": _("person.email", domains=["test.com"], key=str.lower),
-                        "first_name": _("person.name"),
-                        "last_name": _("person.surname"),
-                        "image_url": _("person.avatar"),
-                        "date_joined": _("timestamp", posix=False),
-                    },
-                    "timestamp": _("timestamp", posix=False),
-                    "message": _("text.sentence"),
-                },
-                {
-                    "user": {
-                        "email": _("person.email", domains=["test.com"], key=str.lower),
-                        "first_name": _("person.name"),
-                        "last_name": _("person.surname"),
-                        "image_url": _("person.avatar"),
-                        "date_joined": _("timestamp", posix=False),
-                    },
-                    "timestamp": _("timestamp", posix=False),
-                    "message": _("text.sentence"),
-                },
-                {
-                    "user": {
-                        "email": _("person.email", domains=["test.com"], key=str.lower),
-                        "first_name": _("person.name"),
-                        "last_name": _("person.surname"),
-                        "image_url": _("person.avatar"),
-                        "date_joined": _("timestamp", posix=False),
-                    },
-                    "timestamp": _("timestamp", posix=False),
-                    "message": _("text.sentence"),
-                },
-                {
-                    "user": {
-                        "email": _("person.email", domains=["test.com"], key=str.lower),
-                        "first_name": _("person.name"),
-                        "last_name": _("person.surname"),
-                        "image_url": _("person.avatar"),
-                        "date_joined": _("timestamp", posix=False),
-                    },
-                    "timestamp": _("timestamp", posix=False),
-                    "message": _("text.sentence"),
-                },
-            ],
-            "agent": {
-                "user": {
-                    "email": _("person.email", domains=["test.com"], key=str.lower),
-                    "first_name": _("person.name"),
-                    "last_name": _("person.surname"),
-                    "image_url": _("person.avatar"),
-                    "date_joined": _("timestamp", posix=False),
-                },
-                "phone_number": _("person.telephone"),
-                "agent_display_name": _("business.company"),
-            },
+            **schemas.listing(_),
+            "reviews": [schemas.review(_) for _i in range(5)],
+            "agent": schemas.agent(_),
         }
     )
 
@@ -141,31 +42,8 @@ def saved_listings(request):
     schema = Schema(
         schema=lambda: {
             "id": _("uuid"),
-            "name": _("text.sentence"),
-            "description": _("text"),
-            "lounges": _("numbers.integer_number", start=0, end=8),
-            "is_new": _("development.boolean"),
-            "bedrooms": _("numbers.integer_number", start=0, end=6),
-            "bathrooms": _("numbers.integer_number", start=0, end=8),
-            "no_of_likes": _("numbers.integer_number", start=0, end=100),
-            "location": _("address"),
-            "listing_images": [
-                {"image_url": _("person.avatar")},
-                {"image_url": _("person.avatar")},
-                {"image_url": _("person.avatar")},
-            ],
-            "created_on": _("timestamp", posix=False),
-            "agent": {
-                "user": {
-                    "email": _("person.email", domains=["test.com"], key=str.lower),
-                    "first_name": _("person.name"),
-                    "last_name": _("person.surname"),
-                    "image_url": _("person.avatar"),
-                    "date_joined": _("timestamp", posix=False),
-                },
-                "phone_number": _("person.telephone"),
-                "agent_display_name": _("business.company"),
-            },
+            **schemas.listing(_),
+            "agent": schemas.agent(_),
         }
     )
 
@@ -175,19 +53,7 @@ def saved_listings(request):
 
 @api_view(["GET"])
 def agent_profile(request):
-    schema = Schema(
-        schema=lambda: {
-            "user": {
-                "email": _("person.email", domains=["test.com"], key=str.lower),
-                "first_name": _("person.name"),
-                "last_name": _("person.surname"),
-                "image_url": _("person.avatar"),
-                "date_joined": _("timestamp", posix=False),
-            },
-            "phone_number": _("person.telephone"),
-            "agent_display_name": _("business.company"),
-        }
-    )
+    schema = Schema(schema=lambda: schemas.agent(_))
 
     data = schema.create()
     return Response(data, status=status.HTTP_200_OK)
@@ -195,15 +61,7 @@ def agent_profile(request):
 
 @api_view(["GET"])
 def profile(request):
-    schema = Schema(
-        schema=lambda: {
-            "email": _("person.email", domains=["test.com"], key=str.lower),
-            "first_name": _("person.name"),
-            "last_name": _("person.surname"),
-            "image_url": _("person.avatar"),
-            "date_joined": _("timestamp", posix=False),
-        }
-    )
+    schema = Schema(schema=lambda: schemas.user(_))
 
     data = schema.create()
     return Response(data, status=status.HTTP_200_OK)
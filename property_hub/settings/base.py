@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 import cloudinary
@@ -30,6 +31,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "corsheaders",
     "drf_yasg",
     "rest_framework.authtoken",
@@ -43,7 +45,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "accounts.authentication.CachedTokenAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.AllowAny",
@@ -99,6 +101,15 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "property-hub",
+        # locmem evicts least recently used entries past MAX_ENTRIES
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -153,6 +164,18 @@ HUEY = {
     },
 }
 
+# callable uploading listing images, see `listings.uploads`
+LISTING_IMAGE_UPLOADER = "listings.uploads.cloudinary_upload"
+
+# where listing images wait for their upload, must be shared with the huey workers
+LISTING_IMAGE_SPOOL_DIR = os.environ.get(
+    "LISTING_IMAGE_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "listing-images")
+)
+
+# enforced while the listing upload streams in, see `listings.uploads.StreamingUploadHandler`
+LISTING_UPLOAD_MAX_FILE_SIZE = 15 * 2 ** 20
+LISTING_UPLOAD_MAX_REQUEST_SIZE = 200 * 2 ** 20
+
 CLOUDINARY_CLOUD_NAME = "cloud_name"
 
 CLOUDINARY_API_KEY = 419
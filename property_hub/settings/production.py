@@ -35,6 +35,15 @@ CLOUDINARY = cloudinary.config(
     api_secret=CLOUDINARY_API_SECRET,
 )
 
+# shared between gunicorn workers, eviction is left to redis' maxmemory-policy
+CACHES = {
+    "default": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": env("REDIS_CACHE_URL", default=env("REDIS_URL")),
+        "OPTIONS": {"CLIENT_CLASS": "django_redis.client.DefaultClient"},
+    }
+}
+
 HUEY = {
     "name": "property-hub",
     "url": env("REDIS_URL"),